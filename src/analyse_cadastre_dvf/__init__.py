@@ -0,0 +1,15 @@
+# ================================= PACKAGE ================================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         __init__.py
+# Description :     Analyse des prix de l'immobilier par le cadastre et les dvf
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Version, les modules ne sont importés qu'à leur utilisation
+__version__ = "0.1.0"
+# ============================================================================ #
@@ -0,0 +1,24 @@
+# ================================== MAIN ==================================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         __main__.py
+# Description :     Exécution du package par python -m analyse_cadastre_dvf
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import sys
+# Projet
+from . import cli
+# ============================================================================ #
+
+
+
+# ================================= PROGRAMME ================================ #
+if __name__ == "__main__":
+    sys.exit(cli.main())
+# ============================================================================ #
@@ -0,0 +1,602 @@
+# ================================= ANALYZER ================================= #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         analyzer.py
+# Description :     Augmentation des données du cadastre et des bases dvf
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import re
+import sys
+import copy
+import gzip
+import json
+import hashlib
+import shutil
+import multiprocessing
+# Aliases
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import datetime as dt
+import pyarrow.fs as pafs
+import pyarrow.csv as pacsv
+import pyarrow.dataset as pads
+# Projet
+from . import profiler
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Date
+death_date = dt.date(2017,5,20)
+# Fichiers
+preprocessed_file = "dvf_maison"
+# Colonnes numériques des fichiers dvf, converties à la lecture
+dvf_numeric_columns = {
+    "Valeur fonciere": "float64",
+    "Surface reelle bati": "float64",
+    "Surface terrain": "float64",
+    "Nombre de lots": "float64",
+}
+# Colonnes du numéro de parcelle, valeur par défaut et largeur
+dvf_id_columns = [
+    ("Code departement", "00", 2),
+    ("Code commune", "000", 3),
+    ("Prefixe de section", "000", 3),
+    ("Section", "00", 2),
+    ("No plan", "0000", 4),
+    ("No Volume", "", 0),
+]
+# Types compacts du tableau dvf pretraite, dans l'ordre des colonnes stockées
+dvf_schema = {
+    "No disposition": "category",
+    "Date mutation": "datetime64[s]",
+    "Nature mutation": "category",
+    "Valeur fonciere": "float64",
+    "No voie": "str",
+    "B/T/Q": "category",
+    "Type de voie": "category",
+    "Code voie": "str",
+    "Voie": "category",
+    "Code postal": "category",
+    "Commune": "category",
+    "Code departement": "category",
+    "Code commune": "category",
+    "Prefixe de section": "category",
+    "Section": "category",
+    "No plan": "str",
+    "No Volume": "category",
+    "Code type local": "category",
+    "Type local": "category",
+    "Surface reelle bati": "float32",
+    "Nombre pieces principales": "float32",
+    "Nature culture": "category",
+    "Nature culture speciale": "category",
+    "Surface terrain": "float32",
+    "Jour": "int8",
+    "Mois": "int8",
+    "Annee": "int16",
+    "id": "str",
+}
+# Colonnes de partitionnement des ventes pretraitées
+dvf_partitions = [("Code departement", "str"), ("Annee", "int16")]
+# Manifeste des fichiers sources des ventes pretraitées
+manifest_file = "_manifest.json"
+# Taille des blocs lus à la fois en mode flux, en octets
+dvf_block_size = 64 * 1024 ** 2
+# Parallélisation
+workers = os.cpu_count()
+# Dossiers
+root_directory = "analyse-cadastre-dvf"
+dvf_directory = "dvf"
+enhanced_directory = "enhanced"
+# ============================================================================ #
+
+
+
+# ================================= DOSSIERS ================================= #
+# Trouves le nom de dossier complet pour les données
+def get_data_directory(root = root_directory):
+    current = os.path.realpath('.')
+    path = current.partition(root)[0] + os.sep + root + os.sep + "data" + os.sep
+    return path
+# ---------------------------------------------------------------------------- #
+# Retourne le nom de dossier complet pour les fichiers dvf
+def get_dvf_directory(root = root_directory, dvf = dvf_directory):
+    path = get_data_directory(root) + os.sep + dvf_directory + os.sep
+    path = path.replace("//", "/")
+    return path
+# ---------------------------------------------------------------------------- #
+# Retourne les noms de fichiers dvf
+def get_dvf_files(root = root_directory, dvf = dvf_directory):
+    path = get_dvf_directory(root, dvf)
+    files = sorted([path + f for f in os.listdir(path)])
+    files = [f for f in files if os.path.isfile(f)]
+    files = [f for f in files if f.count(".txt")]
+    return files
+# ============================================================================ #
+
+
+
+# =============================== PRETRAITEMENT ============================== #
+# Options de lecture d'un fichier dvf convertissant les colonnes à la lecture
+def get_dvf_options(filename):
+    with open(filename) as stream:
+        columns = stream.readline().rstrip("\r\n").split("|")
+    types = {
+        c: pa.type_for_alias(dvf_numeric_columns.get(c, "string"))
+        for c in columns
+    }
+    types["Date mutation"] = pa.timestamp("s")
+    parse_options = pacsv.ParseOptions(delimiter = "|")
+    convert_options = pacsv.ConvertOptions(
+        column_types = types,
+        decimal_point = ",",
+        timestamp_parsers = ["%d/%m/%Y"],
+        strings_can_be_null = True
+    )
+    return parse_options, convert_options
+# ---------------------------------------------------------------------------- #
+# Lit un fichier dvf en convertissant les colonnes numériques à la lecture
+def read_dvf_file(filename):
+    parse_options, convert_options = get_dvf_options(filename)
+    table = pacsv.read_csv(
+        filename,
+        parse_options = parse_options,
+        convert_options = convert_options
+    )
+    return table.to_pandas()
+# ---------------------------------------------------------------------------- #
+# Itère sur des blocs d'un fichier dvf sans le charger entièrement
+def iterate_dvf_file(filename, block_size = dvf_block_size):
+    parse_options, convert_options = get_dvf_options(filename)
+    reader = pacsv.open_csv(
+        filename,
+        read_options = pacsv.ReadOptions(block_size = block_size),
+        parse_options = parse_options,
+        convert_options = convert_options
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+# ---------------------------------------------------------------------------- #
+# Supprime les colonnes vides
+def drop_empty_columns(df, keep = None):
+    keep = keep if (keep) else []
+    counts = df.count()
+    empty = [c for c in df.columns[counts == 0] if c not in keep]
+    return df.drop(columns = empty)
+# ---------------------------------------------------------------------------- #
+# Normalise un tableau dvf brut
+def normalize_dvf(df, drop = True):
+    if (drop):
+        df = drop_empty_columns(df, [c[0] for c in dvf_id_columns])
+    # Date
+    df["Jour"] = df["Date mutation"].dt.day
+    df["Mois"] = df["Date mutation"].dt.month
+    df["Annee"] = df["Date mutation"].dt.year
+    # Valeurs flotantes
+    for column in dvf_numeric_columns:
+        df[column] = df[column].fillna(0.)
+    # Code parcelle
+    for column, default, width in dvf_id_columns:
+        if (column not in df.columns):
+            df[column] = default
+        df[column] = df[column].fillna(default).astype(str)
+        if (width > 0):
+            df[column] = df[column].str.pad(width, fillchar = "0")
+    # Numero parcelle
+    df["id"] = df[dvf_id_columns[0][0]]
+    for column, default, width in dvf_id_columns[1:]:
+        df["id"] = df["id"] + df[column]
+    return df
+# ---------------------------------------------------------------------------- #
+# Convertit un tableau dvf normalisé vers les types compacts
+def apply_dvf_schema(df):
+    types = {c: t for c, t in dvf_schema.items() if c in df.columns}
+    for column, kind in types.items():
+        numeric = kind.startswith("float") or kind.startswith("int")
+        if (numeric and not pd.api.types.is_numeric_dtype(df[column])):
+            df[column] = pd.to_numeric(df[column])
+    return df.astype(types)
+# ---------------------------------------------------------------------------- #
+# Type arrow correspondant à un type du tableau dvf pretraite
+def get_dvf_arrow_type(kind):
+    if (kind == "category"):
+        return pa.dictionary(pa.int32(), pa.string())
+    if (kind == "str"):
+        return pa.string()
+    return pa.from_numpy_dtype(np.dtype(kind))
+# ---------------------------------------------------------------------------- #
+# Pretraite les fichiers dvf
+def preprocess_dvf_files(files):
+    file_list = [files] if (type(files) == str) else [x for x in files]
+    df_list = [read_dvf_file(f) for f in file_list]
+    df = pd.concat(df_list, axis = 0, ignore_index = True)
+    return apply_dvf_schema(normalize_dvf(df))
+# ---------------------------------------------------------------------------- #
+# Sélectionne les ventes de maisons exploitables
+def filter_dvf(df):
+    mask = df["Type local"] == "Maison"
+    mask &= df["Date mutation"] < pd.Timestamp(death_date)
+    mask &= df["Nombre de lots"] == 0
+    mask &= df["Valeur fonciere"] > 0.
+    mask &= df["Surface reelle bati"] > 0
+    mask &= df["Surface terrain"] > 0
+    return df[mask].drop(columns = ["Nombre de lots"])
+# ---------------------------------------------------------------------------- #
+# Pretraite et filtre un tableau dvf brut en mesurant chaque étape
+def preprocess_dvf(df):
+    with profiler.stage("normalize_dvf", len(df)):
+        df = normalize_dvf(df, drop = False)
+    with profiler.stage("filter_dvf", len(df)):
+        return filter_dvf(df)
+# ---------------------------------------------------------------------------- #
+# Pretraite et filtre un fichier dvf
+def preprocess_dvf_file(filename):
+    with profiler.stage("read_dvf"):
+        df = read_dvf_file(filename)
+    profiler.count("read_dvf", len(df))
+    return preprocess_dvf(df)
+# ---------------------------------------------------------------------------- #
+# Tâche d'un processus : pretraite et filtre un fichier dvf, avec les mesures
+# du processus si elles sont activées
+def preprocess_dvf_file_task(filename):
+    with profiler.unit("dvf", filename) as record:
+        df = preprocess_dvf_file(filename)
+        record["items"] = len(df)
+    return df, profiler.collect()
+# ---------------------------------------------------------------------------- #
+# Pretraite et filtre les fichiers dvf en parallèle, dans l'ordre des fichiers
+def preprocess_dvf_files_parallel(files, processes = workers):
+    file_list = [files] if (type(files) == str) else [x for x in files]
+    processes = max(1, min(processes or 1, len(file_list)))
+    if (processes == 1):
+        results = [preprocess_dvf_file_task(f) for f in file_list]
+    else:
+        with multiprocessing.Pool(
+            processes, profiler.initialize_worker
+        ) as pool:
+            results = pool.map(preprocess_dvf_file_task, file_list, 1)
+    for df, stats in results:
+        profiler.merge(stats)
+    df = pd.concat([df for df, stats in results], axis = 0, ignore_index = True)
+    with profiler.stage("dvf_schema", len(df)):
+        return apply_dvf_schema(drop_empty_columns(df))
+# ---------------------------------------------------------------------------- #
+# Pretraite et filtre les fichiers dvf bloc par bloc
+def iterate_dvf_files(files, block_size = dvf_block_size):
+    file_list = [files] if (type(files) == str) else [x for x in files]
+    for filename in file_list:
+        with profiler.unit("dvf", filename) as record:
+            blocks = iterate_dvf_file(filename, block_size)
+            for df in profiler.iterate("read_dvf", blocks):
+                df = preprocess_dvf(df)
+                with profiler.stage("dvf_schema", len(df)):
+                    df = apply_dvf_schema(df)
+                record["items"] = record.get("items", 0) + len(df)
+                yield df
+# ============================================================================ #
+
+
+
+# ================================== STOCKAGE ================================ #
+# Schéma arrow des ventes pretraitées stockées
+def get_dvf_arrow_schema():
+    return pa.schema([
+        (c, pa.string() if (t == "category") else get_dvf_arrow_type(t))
+        for c, t in dvf_schema.items()
+    ])
+# ---------------------------------------------------------------------------- #
+# Partitionnement des ventes pretraitées par département et par année
+def get_dvf_partitioning():
+    return pads.partitioning(pa.schema([
+        (c, get_dvf_arrow_type(t)) for c, t in dvf_partitions
+    ]))
+# ---------------------------------------------------------------------------- #
+# Convertit un tableau dvf pretraite en table arrow au schéma fixe
+def make_dvf_table(df):
+    schema = get_dvf_arrow_schema()
+    columns = []
+    for field in schema:
+        if (field.name in df.columns):
+            column = pa.array(df[field.name], from_pandas = True)
+            columns.append(column.cast(field.type))
+        else:
+            columns.append(pa.nulls(len(df), field.type))
+    return pa.table(columns, schema = schema)
+# ---------------------------------------------------------------------------- #
+# Écrit des tableaux dvf dans un dossier partitionné et retourne les fichiers
+def write_dvf_partitions(dfs, path, template = "part-{i}.parquet"):
+    batches = (
+        batch for df in dfs for batch in make_dvf_table(df).to_batches()
+    )
+    files = []
+    pads.write_dataset(
+        batches,
+        path,
+        schema = get_dvf_arrow_schema(),
+        format = "parquet",
+        partitioning = get_dvf_partitioning(),
+        basename_template = template,
+        existing_data_behavior = "overwrite_or_ignore",
+        preserve_order = True,
+        file_visitor = lambda written: files.append(
+            os.path.relpath(written.path, path)
+        )
+    )
+    return sorted(files)
+# ---------------------------------------------------------------------------- #
+# Écrit atomiquement des tableaux dvf dans un dossier partitionné
+def write_dvf_dataset(dfs, path):
+    directory, name = os.path.split(path.rstrip("/"))
+    temporary = os.path.join(directory, "." + name + "." + str(os.getpid()))
+    shutil.rmtree(temporary, ignore_errors = True)
+    os.makedirs(temporary)
+    write_dvf_partitions(dfs, temporary)
+    # Remplace l'ancienne version
+    previous = temporary + ".old"
+    if (os.path.exists(path)):
+        os.rename(path, previous)
+    os.rename(temporary, path)
+    shutil.rmtree(previous, ignore_errors = True)
+# ---------------------------------------------------------------------------- #
+# Sauvegarde les ventes pretraitées, en mémoire bornée ou en parallèle
+def save_preprocessed_file(
+    filename = preprocessed_file,
+    stream = False,
+    block_size = dvf_block_size,
+    processes = workers,
+    report = None,
+    profile = None
+):
+    profiled = report or profile
+    if (profiled):
+        profiler.enable(profile)
+    try:
+        files = get_dvf_files()
+        path = get_dvf_directory() + filename
+        if (stream):
+            dfs = iterate_dvf_files(files, block_size)
+        else:
+            dfs = [preprocess_dvf_files_parallel(files, processes)]
+        with profiler.stage("write_dvf"):
+            write_dvf_dataset(dfs, path)
+        if (report):
+            profiler.write_report(report)
+    finally:
+        if (profiled):
+            profiler.disable()
+# ---------------------------------------------------------------------------- #
+# Calcule l'empreinte d'un fichier source
+def hash_file(filename, size = 1024 ** 2):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as stream:
+        for chunk in iter(lambda: stream.read(size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+# ---------------------------------------------------------------------------- #
+# Charge le manifeste des fichiers sources d'un dossier de ventes pretraitées
+def load_manifest(path):
+    try:
+        with open(os.path.join(path, manifest_file)) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+# ---------------------------------------------------------------------------- #
+# Sauvegarde atomiquement le manifeste des fichiers sources
+def save_manifest(manifest, path):
+    filename = os.path.join(path, manifest_file)
+    temporary = filename + "." + str(os.getpid())
+    with open(temporary, "w") as stream:
+        json.dump(manifest, stream, indent = 1, sort_keys = True)
+    os.replace(temporary, filename)
+# ---------------------------------------------------------------------------- #
+# Supprime les fichiers de ventes pretraitées produits par un fichier source
+def remove_dvf_partitions(name, path):
+    prefix = name + ".part-"
+    for directory, subdirectories, files in os.walk(path):
+        for f in files:
+            if (f.startswith(prefix) and f.endswith(".parquet")):
+                os.remove(os.path.join(directory, f))
+# ---------------------------------------------------------------------------- #
+# Tâche d'un processus : remplace les ventes pretraitées d'un fichier source,
+# avec les mesures du processus si elles sont activées
+def refresh_dvf_file_task(arguments):
+    filename, path, stream, block_size = arguments
+    name = os.path.basename(filename)
+    remove_dvf_partitions(name, path)
+    template = name + ".part-{i}.parquet"
+    if (stream):
+        with profiler.stage("write_dvf"):
+            dfs = iterate_dvf_files(filename, block_size)
+            partitions = write_dvf_partitions(dfs, path, template)
+    else:
+        with profiler.unit("dvf", filename) as record:
+            df = preprocess_dvf_file(filename)
+            with profiler.stage("dvf_schema", len(df)):
+                df = apply_dvf_schema(df)
+            with profiler.stage("write_dvf", len(df)):
+                partitions = write_dvf_partitions([df], path, template)
+            record["items"] = len(df)
+    return name, partitions, profiler.collect()
+# ---------------------------------------------------------------------------- #
+# Met à jour les ventes pretraitées en ne traitant que les fichiers sources
+# nouveaux ou modifiés ; retourne les noms mis à jour, réutilisés et retirés
+def refresh_preprocessed_file(
+    filename = preprocessed_file,
+    stream = False,
+    block_size = dvf_block_size,
+    processes = workers,
+    report = None,
+    profile = None
+):
+    profiled = report or profile
+    if (profiled):
+        profiler.enable(profile)
+    try:
+        files = get_dvf_files()
+        path = get_dvf_directory() + filename
+        manifest = load_manifest(path)
+        # Sans manifeste, le dossier existant n'est pas réutilisable
+        if (manifest is None):
+            shutil.rmtree(path, ignore_errors = True)
+            os.makedirs(path)
+            manifest = {}
+        # Compare les fichiers sources au manifeste
+        sources = {}
+        tasks = []
+        for f in files:
+            name = os.path.basename(f)
+            status = os.stat(f)
+            entry = manifest.get(name, {})
+            source = {"size": status.st_size, "mtime": status.st_mtime_ns}
+            if (entry.get("size") == source["size"]):
+                if (entry.get("mtime") == source["mtime"]):
+                    sources[name] = entry
+                    continue
+            source["hash"] = hash_file(f)
+            if (entry.get("hash") == source["hash"]):
+                sources[name] = dict(entry, **source)
+                continue
+            sources[name] = source
+            tasks.append((f, path, stream, block_size))
+        removed = sorted([name for name in manifest if name not in sources])
+        for name in removed:
+            remove_dvf_partitions(name, path)
+        # Traite les fichiers nouveaux ou modifiés
+        processes = max(1, min(processes or 1, len(tasks)))
+        if (processes == 1):
+            results = [refresh_dvf_file_task(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(
+                processes, profiler.initialize_worker
+            ) as pool:
+                results = pool.map(refresh_dvf_file_task, tasks, 1)
+        for name, partitions, stats in results:
+            sources[name]["files"] = partitions
+            profiler.merge(stats)
+        save_manifest(sources, path)
+        if (report):
+            profiler.write_report(report)
+        updated = sorted([name for name, partitions, stats in results])
+        reused = sorted([name for name in sources if name not in updated])
+        return updated, reused, removed
+    finally:
+        if (profiled):
+            profiler.disable()
+# ---------------------------------------------------------------------------- #
+# Charge les ventes pretraitées avec les types compacts, en ne lisant que les
+# colonnes et les partitions demandées
+def load_preprocessed_file(
+    filename = preprocessed_file,
+    columns = None,
+    departments = None,
+    start = None,
+    end = None,
+    minimum = None,
+    maximum = None
+):
+    path = get_dvf_directory() + filename
+    categories = [c for c, t in dvf_schema.items() if t == "category"]
+    dataset = pads.dataset(
+        path,
+        format = pads.ParquetFileFormat(
+            read_options = {"dictionary_columns": categories}
+        ),
+        partitioning = get_dvf_partitioning()
+    )
+    # Filtres transmis au lecteur de fichiers
+    conditions = []
+    if (departments):
+        departments = [str(x) for x in departments]
+        conditions.append(pads.field("Code departement").isin(departments))
+    if (start is not None):
+        start = pd.Timestamp(start)
+        conditions.append(pads.field("Annee") >= start.year)
+        conditions.append(pads.field("Date mutation") >= start.to_datetime64())
+    if (end is not None):
+        end = pd.Timestamp(end)
+        conditions.append(pads.field("Annee") <= end.year)
+        conditions.append(pads.field("Date mutation") < end.to_datetime64())
+    if (minimum is not None):
+        conditions.append(pads.field("Valeur fonciere") >= minimum)
+    if (maximum is not None):
+        conditions.append(pads.field("Valeur fonciere") <= maximum)
+    condition = conditions[0] if (conditions) else None
+    for expression in conditions[1:]:
+        condition = condition & expression
+    # Lecture dans l'ordre des colonnes du schéma
+    if (columns is None):
+        columns = [c for c in dvf_schema if c in dataset.schema.names]
+    table = dataset.to_table(columns = columns, filter = condition)
+    return apply_dvf_schema(table.to_pandas())
+# ============================================================================ #
+
+
+
+# ============================ PARCELLES AUGMENTEES ========================== #
+# Retourne le nom de dossier complet pour les parcelles augmentées
+def get_enhanced_directory(
+    root = root_directory,
+    enhanced = enhanced_directory
+):
+    path = get_data_directory(root) + os.sep + enhanced + os.sep
+    path = path.replace("//", "/")
+    return path
+# ---------------------------------------------------------------------------- #
+# Charge la table des parcelles augmentées par projection mémoire
+def load_enhanced_lands(departments = None, columns = None, directory = None):
+    path = directory if (directory) else get_enhanced_directory()
+    dataset = pads.dataset(
+        path,
+        format = "ipc",
+        filesystem = pafs.LocalFileSystem(use_mmap = True),
+        partitioning = pads.partitioning(
+            pa.schema([("department", pa.string())])
+        )
+    )
+    condition = None
+    if (departments):
+        departments = [str(x) for x in departments]
+        condition = pads.field("department").isin(departments)
+    table = dataset.to_table(columns = columns, filter = condition)
+    return table.to_pandas()
+# ---------------------------------------------------------------------------- #
+# Convertit les numéros de parcelle dvf en identifiants du cadastre : dans les
+# départements d'outre-mer, le code insee garde les deux derniers chiffres du
+# code commune après les trois chiffres du département
+def get_cadastre_ids(df):
+    ids = df["id"].astype(str)
+    overseas = df["Code departement"].astype(str).str.len() == 3
+    ids = ids.where(~overseas, ids.str[:3] + ids.str[4:])
+    return ids
+# ---------------------------------------------------------------------------- #
+# Associe les parcelles augmentées aux mutations dvf par identifiant du cadastre
+def join_enhanced_lands(df, lands):
+    lands = lands.drop(
+        columns = [c for c in lands.columns if c in df.columns and c != "id"]
+    )
+    lands = lands.rename(columns = {"id": "cadastre_id"})
+    df = df.assign(cadastre_id = get_cadastre_ids(df))
+    df = df.merge(lands, on = "cadastre_id", how = "left")
+    return df.drop(columns = ["cadastre_id"])
+# ============================================================================ #
+
+
+
+# ================================= PROGRAMME ================================ #
+# Programme principal
+def main():
+    df = load_preprocessed_file()
+# ---------------------------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
+# ============================================================================ #
@@ -0,0 +1,614 @@
+# ================================= BENCHMARK ================================ #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         benchmark.py
+# Description :     Mesure des performances sur des données synthétiques
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import sys
+import json
+import time
+import tempfile
+import contextlib
+import subprocess
+# Aliases
+import numpy as np
+import pandas as pd
+import shapely as sp
+# Projet
+from . import metrics
+from . import analyzer
+from . import enhancer
+from . import profiler
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Colonnes des fichiers dvf
+dvf_columns = [
+    "Code service CH", "Reference document", "1 Articles CGI",
+    "2 Articles CGI", "3 Articles CGI", "4 Articles CGI", "5 Articles CGI",
+    "No disposition", "Date mutation", "Nature mutation", "Valeur fonciere",
+    "No voie", "B/T/Q", "Type de voie", "Code voie", "Voie", "Code postal",
+    "Commune", "Code departement", "Code commune", "Prefixe de section",
+    "Section", "No plan", "No Volume", "1er lot", "Surface Carrez du 1er lot",
+    "2eme lot", "Surface Carrez du 2eme lot", "3eme lot",
+    "Surface Carrez du 3eme lot", "4eme lot", "Surface Carrez du 4eme lot",
+    "5eme lot", "Surface Carrez du 5eme lot", "Nombre de lots",
+    "Code type local", "Type local", "Identifiant local",
+    "Surface reelle bati", "Nombre pieces principales", "Nature culture",
+    "Nature culture speciale", "Surface terrain",
+]
+# Taille par défaut des données générées
+dvf_rows = 200000
+# Années des fichiers dvf générés pour le prétraitement complet
+dvf_years = [2014, 2015, 2016, 2017]
+# Code insee et nombre de lots par côté des communes générées
+city_code = "01001"
+city_size = 60
+# Position de la commune générée en degrés
+city_longitude = 5.2
+city_latitude = 46.2
+# Dimensions des lots et des bâtiments en mètres
+lot_widths = (12., 40.)
+lot_depths = (20., 60.)
+building_widths = (6., 14.)
+building_depths = (8., 18.)
+# Nombre de bâtiments par lot, tiré uniformément dans la liste
+building_counts = [0, 1, 1, 1, 2, 3]
+# Probabilités d'une annexe chevauchant un bâtiment et d'un bâtiment à cheval
+# sur la limite entre deux lots
+overlap_probability = 0.15
+crossing_probability = 0.1
+# Longueur d'un degré de latitude en mètres
+degree_length = 111320.
+# Date des éléments du cadastre générés
+cadastre_date = "2017-06-01"
+# Nombre de répétitions de chaque mesure, dont on garde la plus rapide
+repeats = 3
+# Modules dont on mesure le temps d'import dans un nouveau processus
+startup_modules = ["installer", "enhancer", "analyzer"]
+# Fichier de référence des mesures et baisse de débit tolérée
+baseline_file = "benchmark-baseline.json"
+regression_tolerance = 0.25
+# Graine aléatoire
+seed = 42
+# ============================================================================ #
+
+
+
+# ================================ GENERATION ================================ #
+# Formate des flottants avec une virgule décimale
+def format_decimal(values, decimals = 2):
+    text = np.char.mod("%." + str(decimals) + "f", values)
+    return np.char.replace(text, ".", ",")
+# ---------------------------------------------------------------------------- #
+# Génère un tableau au format dvf
+def generate_dvf(rows = dvf_rows, year = 2017, random = None):
+    random = random if (random is not None) else np.random.default_rng(seed)
+    empty = np.full(rows, "", dtype = object)
+    departments = np.array(["01", "13", "2A", "33", "69", "75", "971"])
+    department = departments[random.integers(0, len(departments), rows)]
+    kinds = np.array(["Maison", "Appartement", "Dépendance", ""])
+    kind = kinds[random.choice(len(kinds), rows, p = [.35, .35, .2, .1])]
+    day = random.integers(1, 29, rows)
+    month = random.integers(1, 13, rows)
+    lots = random.choice([0, 0, 0, 1, 2], rows)
+    prefix = np.where(random.random(rows) < .9, "", "000")
+    columns = {c: empty for c in dvf_columns}
+    columns.update({
+        "No disposition": np.full(rows, "000001", dtype = object),
+        "Date mutation": np.char.add(np.char.add(
+            np.char.add(np.char.zfill(day.astype(str), 2), "/"),
+            np.char.add(np.char.zfill(month.astype(str), 2), "/")
+        ), str(year)),
+        "Nature mutation": np.where(
+            random.random(rows) < .9, "Vente", "Echange"
+        ),
+        "Valeur fonciere": format_decimal(
+            np.round(random.lognormal(12, 1, rows), -2)
+        ),
+        "No voie": random.integers(1, 200, rows).astype(str),
+        "Type de voie": np.where(random.random(rows) < .5, "RUE", "AV"),
+        "Voie": np.full(rows, "DE LA REPUBLIQUE", dtype = object),
+        "Code postal": random.integers(1000, 95999, rows).astype(str),
+        "Commune": np.char.add(
+            "COMMUNE ", random.integers(1, 500, rows).astype(str)
+        ),
+        "Code departement": department,
+        "Code commune": random.integers(1, 999, rows).astype(str),
+        "Prefixe de section": prefix,
+        "Section": np.array(["A", "AB", "ZM", "C"])[
+            random.integers(0, 4, rows)
+        ],
+        "No plan": random.integers(1, 3000, rows).astype(str),
+        "Nombre de lots": lots.astype(str),
+        "Code type local": random.integers(1, 4, rows).astype(str),
+        "Type local": kind,
+        "Surface reelle bati": np.where(
+            kind == "", "", random.integers(10, 300, rows).astype(str)
+        ),
+        "Nombre pieces principales": random.integers(0, 8, rows).astype(str),
+        "Nature culture": np.where(random.random(rows) < .7, "S", "AG"),
+        "Surface terrain": np.where(
+            random.random(rows) < .2, "",
+            random.integers(50, 5000, rows).astype(str)
+        ),
+    })
+    return pd.DataFrame(columns)[dvf_columns]
+# ---------------------------------------------------------------------------- #
+# Génère un fichier au format dvf
+def generate_dvf_file(filename, rows = dvf_rows, year = 2017, random = None):
+    df = generate_dvf(rows, year, random)
+    df.to_csv(filename, sep = "|", index = False)
+    return filename
+# ---------------------------------------------------------------------------- #
+# Génère les sommets en mètres d'une grille de lots irréguliers
+def generate_lots_grid(size, random):
+    x = np.concatenate([[0.], np.cumsum(random.uniform(*lot_widths, size))])
+    y = np.concatenate([[0.], np.cumsum(random.uniform(*lot_depths, size))])
+    x, y = np.meshgrid(x, y, indexing = "ij")
+    # Déplace les sommets intérieurs sans que les lots se recouvrent
+    jitter = 0.2 * min(lot_widths[0], lot_depths[0])
+    inner = (size - 1, size - 1)
+    x[1:-1, 1:-1] += random.uniform(-jitter, jitter, inner)
+    y[1:-1, 1:-1] += random.uniform(-jitter, jitter, inner)
+    return x, y
+# ---------------------------------------------------------------------------- #
+# Génère un rectangle tourné en mètres autour d'un centre
+def generate_rectangle(x, y, width, depth, angle):
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]]) / 2.
+    corners = corners * [width, depth]
+    rotation = np.array([
+        [np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]
+    ])
+    return corners @ rotation.T + [x, y]
+# ---------------------------------------------------------------------------- #
+# Convertit un anneau en mètres en coordonnées geojson en degrés
+def to_coordinates(ring):
+    scale = degree_length * np.cos(np.radians(city_latitude))
+    longitudes = city_longitude + ring[:, 0] / scale
+    latitudes = city_latitude + ring[:, 1] / degree_length
+    return np.round(np.column_stack([longitudes, latitudes]), 7).tolist()
+# ---------------------------------------------------------------------------- #
+# Retourne le code de section cadastrale d'un numéro de section
+def get_section(index):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    if (index < len(letters)):
+        return "0" + letters[index]
+    return letters[index // len(letters) - 1] + letters[index % len(letters)]
+# ---------------------------------------------------------------------------- #
+# Génère les parcelles et les bâtiments geojson d'une commune : des lots en
+# grille irrégulière avec des bâtiments, dont certains se chevauchent ou
+# débordent sur le lot voisin
+def generate_city(insee = city_code, size = city_size, random = None):
+    random = random if (random is not None) else np.random.default_rng(seed)
+    x, y = generate_lots_grid(size, random)
+    lands = []
+    buildings = []
+    properties = {
+        "commune": insee, "created": cadastre_date, "updated": cadastre_date
+    }
+    for i in range(size):
+        section = get_section(i // 10)
+        for j in range(size):
+            # Parcelle
+            corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1), (i, j)]
+            ring = np.array([[x[c], y[c]] for c in corners])
+            area = np.abs(np.dot(ring[:-1, 0], ring[1:, 1]) - np.dot(
+                ring[1:, 0], ring[:-1, 1]
+            )) / 2.
+            number = str((i % 10) * size + j + 1).zfill(4)
+            code = insee + "000" + section + number
+            lands.append({
+                "type": "Feature",
+                "id": code,
+                "geometry": {
+                    "type": "Polygon", "coordinates": [to_coordinates(ring)]
+                },
+                "properties": dict(
+                    properties, id = code, prefixe = "000", section = section,
+                    numero = number, contenance = int(round(area)),
+                    arpente = False
+                ),
+            })
+            # Bâtiments placés par interpolation entre les coins du lot
+            for k in range(random.choice(building_counts)):
+                u, v = random.uniform(0.25, 0.75, 2)
+                if (random.random() < crossing_probability):
+                    u = 1.
+                center = (
+                    (1 - u) * (1 - v) * ring[0] + u * (1 - v) * ring[1]
+                    + u * v * ring[2] + (1 - u) * v * ring[3]
+                )
+                width = random.uniform(*building_widths)
+                depth = random.uniform(*building_depths)
+                angle = random.uniform(-0.2, 0.2)
+                shapes = [generate_rectangle(*center, width, depth, angle)]
+                if (random.random() < overlap_probability):
+                    shapes.append(generate_rectangle(
+                        center[0] + width / 2, center[1],
+                        width / 2, depth / 2, angle
+                    ))
+                for shape in shapes:
+                    buildings.append({
+                        "type": "Feature",
+                        "geometry": {
+                            "type": "Polygon",
+                            "coordinates": [to_coordinates(shape)]
+                        },
+                        "properties": dict(properties, type = "01", nom = None),
+                    })
+    return lands, buildings
+# ---------------------------------------------------------------------------- #
+# Génère les fichiers geojson d'une commune dans un dossier du cadastre
+def generate_city_files(
+    root,
+    insee = city_code,
+    size = city_size,
+    random = None
+):
+    lands, buildings = generate_city(insee, size, random)
+    directory = enhancer.get_city_directory(insee, root)
+    os.makedirs(directory, exist_ok = True)
+    for kind in enhancer.city_kinds:
+        features = {"parcelles": lands, "batiments": buildings}.get(kind, [])
+        filename = enhancer.get_filename(directory, insee, kind)
+        with open(filename, "w") as stream:
+            json.dump(
+                {"type": "FeatureCollection", "features": features}, stream
+            )
+    return len(lands), len(buildings)
+# ---------------------------------------------------------------------------- #
+# Génère des fichiers dvf annuels dans le dossier dvf courant
+def generate_dvf_files(rows = dvf_rows, years = dvf_years, random = None):
+    random = random if (random is not None) else np.random.default_rng(seed)
+    directory = analyzer.get_dvf_directory()
+    os.makedirs(directory, exist_ok = True)
+    files = []
+    for year in years:
+        filename = directory + "valeursfoncieres-" + str(year) + ".txt"
+        files.append(generate_dvf_file(
+            filename, rows // len(years), year, random
+        ))
+    return files
+# ============================================================================ #
+
+
+
+# ================================ REFERENCES ================================ #
+# Ancienne version du prétraitement, par compréhensions de listes
+def preprocess_dvf_files_reference(files):
+    file_list = [files] if (type(files) == str) else [x for x in files]
+    df_list = [pd.read_csv(f, sep = "|" , dtype = str) for f in file_list]
+    df = pd.concat(df_list, axis = 0, ignore_index = True)
+    df.drop(
+        columns = [c for c in df.columns if df[c].nunique() == 0],
+        inplace = True
+    )
+    df["Jour"] = [x.split("/")[0] for x in df["Date mutation"]]
+    df["Mois"] = [x.split("/")[1] for x in df["Date mutation"]]
+    df["Annee"] = [x.split("/")[2] for x in df["Date mutation"]]
+    for c in ["Valeur fonciere", "Surface reelle bati", "Surface terrain"]:
+        df[c] = df[c].fillna("0")
+        df[c] = [str(x).replace(",", ".") for x in df[c]]
+    df["Nombre de lots"] = df["Nombre de lots"].fillna("0")
+    for c, default, width in analyzer.dvf_id_columns:
+        df[c] = df[c].fillna(default) if (c in df.columns) else default
+        df[c] = [str(x).rjust(width, "0") for x in df[c]]
+    df["id"] = df["Code departement"] + df["Code commune"]
+    df["id"] += df["Prefixe de section"] + df["Section"] + df["No plan"]
+    df["id"] += df["No Volume"]
+    return df
+# ============================================================================ #
+
+
+
+# ================================== MESURES ================================= #
+# Mesure le temps d'exécution d'une fonction
+def measure(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+# ---------------------------------------------------------------------------- #
+# Mesure le temps d'exécution, le pic de mémoire résidente et sa hausse par
+# rapport à la mémoire de départ
+def measure_memory(function, *args, **kwargs):
+    start = profiler.get_rss()
+    profiler.reset_peak_rss()
+    result, seconds = measure(function, *args, **kwargs)
+    peak = profiler.get_peak_rss()
+    return result, seconds, peak, max(peak - start, 0)
+# ---------------------------------------------------------------------------- #
+# Mesure une fonction traitant un nombre d'éléments donné, en gardant le
+# meilleur temps de plusieurs répétitions et la mémoire de la première
+def run_benchmark(name, items, function, *args, repeat = None, **kwargs):
+    repeat = repeat if (repeat) else repeats
+    result, seconds, peak, increase = measure_memory(function, *args, **kwargs)
+    for i in range(1, repeat):
+        seconds = min(seconds, measure(function, *args, **kwargs)[1])
+    return make_record(name, items, seconds, peak, increase)
+# ---------------------------------------------------------------------------- #
+# Enregistre et affiche une mesure
+def make_record(name, items, seconds, peak, increase):
+    record = {
+        "name": name,
+        "items": int(items),
+        "seconds": seconds,
+        "throughput": items / max(seconds, 1e-9),
+        "peak_rss": peak,
+        "rss_increase": increase,
+    }
+    print("  %-28s %12.0f éléments/s %8.3f s %8.1f Mo %+8.1f Mo" % (
+        name, record["throughput"], seconds,
+        peak / 1024 ** 2, increase / 1024 ** 2
+    ))
+    return record
+# ---------------------------------------------------------------------------- #
+# Exécute temporairement depuis un dossier, ce qui y place les données
+@contextlib.contextmanager
+def working_directory(directory):
+    current = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield directory
+    finally:
+        os.chdir(current)
+# ---------------------------------------------------------------------------- #
+# Charge entièrement les parcelles et les bâtiments d'une commune, jusqu'aux
+# identifiants et aux géométries utilisés par l'analyse
+def load_city_features(insee, root):
+    city = enhancer.load_city(insee, root, ["parcelles", "batiments"])
+    lands, buildings = city["parcelles"], city["batiments"]
+    enhancer.get_ids(lands)
+    enhancer.get_shapes(lands)
+    enhancer.get_shapes(buildings)
+    return lands, buildings
+# ---------------------------------------------------------------------------- #
+# Calcule les propriétés des parcelles une par une avec la classe Polygon
+def measure_polygons(shapes):
+    return [
+        (p.area, p.perimeter, p.rectangle_min, p.rectangle_max, p.ratio)
+        for p in [enhancer.Polygon(shape) for shape in shapes]
+    ]
+# ---------------------------------------------------------------------------- #
+# Analyse les bâtiments des parcelles une par une
+def run_parcels_loop(shapes, buildings_tree):
+    paths = {"none": 0, "single": 0, "disjoint": 0, "union": 0}
+    paths.update({"planar": 0, "geodesic": 0})
+    return [
+        enhancer.crop_buildings(shape, enhancer.merge_buildings(
+            enhancer.find_buildings_on_land(shape, buildings_tree), paths
+        ), paths = paths)
+        for shape in shapes
+    ]
+# ---------------------------------------------------------------------------- #
+# Mesure les étapes de l'analyse d'une commune générée
+def benchmark_cadastre(size = city_size, directory = None):
+    with tempfile.TemporaryDirectory(dir = directory) as tmp:
+        with working_directory(tmp):
+            root = os.path.join(tmp, "cadastre")
+            nlands, nbuildings = generate_city_files(root, city_code, size)
+            print("Cadastre :", nlands, "parcelles,", nbuildings, "bâtiments")
+            use_cache = enhancer.use_cache
+            try:
+                # Chargement
+                enhancer.use_cache = False
+                results = [run_benchmark(
+                    "load_city json", nlands + nbuildings,
+                    load_city_features, city_code, root
+                )]
+                enhancer.use_cache = True
+                results.append(run_benchmark(
+                    "load_city cache froid", nlands + nbuildings,
+                    load_city_features, city_code, root, repeat = 1
+                ))
+                results.append(run_benchmark(
+                    "load_city cache chaud", nlands + nbuildings,
+                    load_city_features, city_code, root
+                ))
+                lands, buildings = load_city_features(city_code, root)
+                shapes = np.asarray(enhancer.get_shapes(lands), dtype = object)
+                # Arbre des bâtiments et propriétés des parcelles
+                results.append(run_benchmark(
+                    "make_buildings_tree", nbuildings,
+                    enhancer.make_buildings_tree, buildings
+                ))
+                tree = enhancer.make_buildings_tree(buildings)
+                results.append(run_benchmark(
+                    "Polygon", nlands, measure_polygons, shapes
+                ))
+                results.append(run_benchmark(
+                    "compute_features_metrics", nlands,
+                    metrics.compute_features_metrics, lands
+                ))
+                # Analyse des bâtiments par parcelle
+                results.append(run_benchmark(
+                    "boucle parcelles", nlands, run_parcels_loop, shapes, tree
+                ))
+                results.append(run_benchmark(
+                    "enhance_city", nlands,
+                    enhancer.enhance_city, city_code, root
+                ))
+            finally:
+                enhancer.use_cache = use_cache
+    return results
+# ---------------------------------------------------------------------------- #
+# Mesure le prétraitement et la sauvegarde de fichiers dvf générés
+def benchmark_dvf(rows = dvf_rows, directory = None):
+    with tempfile.TemporaryDirectory(dir = directory) as tmp:
+        with working_directory(tmp):
+            files = generate_dvf_files(rows)
+            rows = (rows // len(files)) * len(files)
+            print("DVF :", len(files), "fichiers,", rows, "lignes")
+            results = [run_benchmark(
+                "preprocess_dvf_files ancien", rows,
+                preprocess_dvf_files_reference, files
+            )]
+            results.append(run_benchmark(
+                "preprocess_dvf_files", rows,
+                analyzer.preprocess_dvf_files, files
+            ))
+            results.append(run_benchmark(
+                "save_preprocessed_file", rows, analyzer.save_preprocessed_file
+            ))
+            results.append(run_benchmark(
+                "save_preprocessed_file flux", rows,
+                analyzer.save_preprocessed_file, stream = True
+            ))
+    return results
+# ---------------------------------------------------------------------------- #
+# Retourne le code python des commandes de démarrage mesurées
+def get_startup_commands():
+    commands = {"aide": "\n".join([
+        "import sys, runpy",
+        "sys.argv = ['analyse-cadastre-dvf', '--help']",
+        "runpy.run_module('" + __package__ + "', run_name = '__main__')",
+    ])}
+    for name in startup_modules:
+        commands["import " + name] = "import " + __package__ + "." + name
+    return commands
+# ---------------------------------------------------------------------------- #
+# Exécute du code python dans un nouveau processus et retourne sa durée et son
+# pic de mémoire résidente, que le processus écrit en sortie d'erreur à la fin
+# car celui rapporté au parent inclut la mémoire du parent lors du fork
+def measure_process(code):
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = [directory, os.environ.get("PYTHONPATH", "")]
+    environment = dict(os.environ, PYTHONPATH = os.pathsep.join(paths))
+    probe = "\n".join([
+        "import atexit, sys",
+        "atexit.register(lambda: sys.stderr.write(",
+        "    open('/proc/self/status').read() if (sys.platform == 'linux')",
+        "    else ''",
+        "))",
+    ])
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", probe + "\n" + code],
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.PIPE,
+        env = environment,
+        text = True,
+        check = True
+    )
+    seconds = time.perf_counter() - start
+    peak = 0
+    for line in process.stderr.splitlines():
+        if (line.startswith("VmHWM:")):
+            peak = int(line.split()[1]) * 1024
+    return seconds, peak
+# ---------------------------------------------------------------------------- #
+# Mesure le temps de démarrage de la ligne de commande et d'import des modules
+# dans un nouveau processus, comme pour un processus de calcul
+def benchmark_startup(repeat = None):
+    repeat = repeat if (repeat) else repeats
+    print("Démarrage :", sys.executable)
+    results = []
+    for name, arguments in get_startup_commands().items():
+        measures = [measure_process(arguments) for i in range(repeat)]
+        seconds = min(seconds for seconds, peak in measures)
+        peak = measures[0][1]
+        results.append(make_record("démarrage " + name, 1, seconds, peak, peak))
+    return results
+# ============================================================================ #
+
+
+
+# ================================= REFERENCE ================================ #
+# Retourne le fichier de référence des mesures
+def get_baseline_file():
+    return enhancer.get_data_directory() + baseline_file
+# ---------------------------------------------------------------------------- #
+# Décrit les conditions des mesures
+def get_environment(size, rows):
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "shapely": sp.__version__,
+        "cpus": os.cpu_count(),
+        "city_size": size,
+        "dvf_rows": rows,
+        "seed": seed,
+    }
+# ---------------------------------------------------------------------------- #
+# Charge des mesures sauvegardées
+def load_baseline(filename = None):
+    filename = filename if (filename) else get_baseline_file()
+    try:
+        with open(filename) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+# ---------------------------------------------------------------------------- #
+# Sauvegarde des mesures comme référence
+def save_baseline(report, filename = None):
+    filename = filename if (filename) else get_baseline_file()
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok = True)
+    with open(filename, "w") as stream:
+        json.dump(report, stream, indent = 1)
+    return filename
+# ---------------------------------------------------------------------------- #
+# Compare des mesures à la référence et retourne les étapes ralenties
+def compare_baseline(report, baseline, tolerance = regression_tolerance):
+    if (report["environment"] != baseline["environment"]):
+        print("Attention : conditions différentes de la référence")
+    reference = {record["name"]: record for record in baseline["results"]}
+    regressions = []
+    print("Comparaison à la référence :")
+    for record in report["results"]:
+        if (record["name"] not in reference):
+            continue
+        before = reference[record["name"]]
+        speed = record["throughput"] / max(before["throughput"], 1e-9)
+        memory = record["peak_rss"] / max(before["peak_rss"], 1)
+        slower = speed < 1. - tolerance
+        if (slower):
+            regressions.append(record["name"])
+        print("  %-28s débit x%.2f | mémoire x%.2f%s" % (
+            record["name"], speed, memory, " | RALENTI" if (slower) else ""
+        ))
+    return regressions
+# ---------------------------------------------------------------------------- #
+# Exécute toutes les mesures hors ligne
+def run_benchmarks(size = city_size, rows = dvf_rows, directory = None):
+    results = benchmark_cadastre(size, directory)
+    results += benchmark_dvf(rows, directory)
+    results += benchmark_startup()
+    return {"environment": get_environment(size, rows), "results": results}
+# ============================================================================ #
+
+
+
+# ================================= PROGRAMME ================================ #
+# Programme principal : compare les mesures à la référence, ou l'enregistre
+# si elle n'existe pas encore ; ne mesure que le démarrage si demandé
+def main(
+    size = city_size,
+    rows = dvf_rows,
+    filename = None,
+    startup = False
+):
+    if (startup):
+        benchmark_startup()
+        return []
+    filename = filename if (filename) else get_baseline_file()
+    report = run_benchmarks(size, rows)
+    baseline = load_baseline(filename)
+    if (baseline is None):
+        print("Référence enregistrée :", save_baseline(report, filename))
+        return []
+    return compare_baseline(report, baseline)
+# ---------------------------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
+# ============================================================================ #
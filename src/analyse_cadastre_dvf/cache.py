@@ -0,0 +1,233 @@
+# =================================== CACHE ================================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         cache.py
+# Description :     Cache binaire des fichiers json du cadastre
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import json
+import hashlib
+# Aliases
+import numpy as np
+import pyarrow as pa
+import shapely as sp
+import shapely.geometry as geom
+# Projet
+from . import metrics
+from . import streaming
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Dossiers
+root_directory = "analyse-cadastre-dvf"
+cache_directory = "cache"
+# Taille maximale du cache en octets
+cache_size = 8 * 1024 ** 3
+# Nombre d'éléments json décodés à la fois lors de la création du cache
+parse_batch_size = 10000
+# Colonnes réservées à la géométrie
+id_column = "_id"
+wkb_column = "_wkb"
+coordinates_column = "_coordinates"
+rings_column = "_rings"
+geometry_columns = [id_column, wkb_column, coordinates_column, rings_column]
+# ============================================================================ #
+
+
+
+# ================================= DOSSIERS ================================= #
+# Trouves le nom de dossier complet pour les données
+def get_data_directory(root = root_directory):
+    current = os.path.realpath('.')
+    path = current.partition(root)[0] + os.sep + root + os.sep + "data" + os.sep
+    return path
+# ---------------------------------------------------------------------------- #
+# Retourne le nom de dossier complet pour le cache
+def get_cache_directory(root = root_directory, cache = cache_directory):
+    path = get_data_directory(root) + os.sep + cache + os.sep
+    path = path.replace("//", "/")
+    return path
+# ---------------------------------------------------------------------------- #
+# Retourne le nom du fichier de cache associé à un fichier json
+def get_cache_file(filename, directory = None):
+    directory = directory if (directory) else get_cache_directory()
+    status = os.stat(filename)
+    key = os.path.realpath(filename) + "|" + str(status.st_size)
+    key += "|" + str(status.st_mtime_ns)
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".arrow"
+    return os.path.join(directory, name)
+# ============================================================================ #
+
+
+
+# ================================= ELEMENTS ================================= #
+# Décode une colonne de géométries wkb, sans passer par la conversion numpy
+# des colonnes binaires qui importe pandas
+def read_shapes(column):
+    return sp.from_wkb(np.array(column.to_pylist(), dtype = object))
+# ---------------------------------------------------------------------------- #
+# Converti un lot de colonnes en éléments json
+def make_features(batch):
+    names = [x for x in batch.schema.names if x not in geometry_columns]
+    ids = batch.column(id_column).to_pylist()
+    geometries = sp.to_geojson(read_shapes(batch.column(wkb_column)))
+    properties = batch.select(names).to_pylist()
+    features = []
+    for i, geometry in enumerate(geometries):
+        feature = {"type": "Feature"}
+        # Les éléments sans identifiant n'en reçoivent pas
+        if (ids[i] is not None):
+            feature["id"] = ids[i]
+        feature["geometry"] = json.loads(geometry) if (geometry) else None
+        feature["properties"] = properties[i]
+        features.append(feature)
+    return features
+# ---------------------------------------------------------------------------- #
+# Collection d'éléments json stockée sous forme de colonnes
+class Features:
+    # Constructeur
+    def __init__(self, table):
+        self.table = table
+        self.features = None
+    # Nombre d'éléments
+    def __len__(self):
+        return self.table.num_rows
+    # Accès à un élément sous forme de dictionnaire json, la table étant
+    # convertie en une fois au premier accès
+    def __getitem__(self, index):
+        if (self.features is None):
+            self.features = list(self)
+        return self.features[index]
+    # Itération sur les éléments, convertis lot par lot
+    def __iter__(self):
+        if (self.features is not None):
+            yield from self.features
+            return
+        for batch in self.table.to_batches():
+            yield from make_features(batch)
+    # Itération sur des lots d'éléments de taille fixe
+    def batches(self, batch_size):
+        for start in range(0, len(self), batch_size):
+            yield Features(self.table.slice(start, batch_size))
+    # Identifiants des éléments
+    def ids(self):
+        return self.table.column(id_column).to_pylist()
+    # Géométries shapely des éléments
+    def shapes(self):
+        return list(read_shapes(self.table.column(wkb_column)))
+    # Coordonnées aplaties des anneaux extérieurs
+    def flat(self):
+        coordinates = self.table.column(coordinates_column).combine_chunks()
+        rings = self.table.column(rings_column).combine_chunks()
+        points = coordinates.flatten().to_numpy().reshape(-1, 2)
+        lengths = rings.flatten().to_numpy()
+        ring_offsets = np.zeros(len(lengths) + 1, dtype = np.int64)
+        np.cumsum(lengths, out = ring_offsets[1:])
+        feature_offsets = rings.offsets.to_numpy().astype(np.int64)
+        feature_offsets -= feature_offsets[0]
+        return points, ring_offsets, feature_offsets
+# ---------------------------------------------------------------------------- #
+# Converti une liste d'éléments json en table
+def make_table(features):
+    # Propriétés
+    properties = pa.Table.from_pylist(
+        [feature.get("properties") or {} for feature in features]
+    )
+    # Géométries
+    shapes = [geom.shape(feature["geometry"]) for feature in features]
+    points, ring_offsets, feature_offsets = metrics.flatten_features(features)
+    point_offsets = ring_offsets[feature_offsets] * 2
+    coordinates = pa.ListArray.from_arrays(
+        pa.array(point_offsets, type = pa.int32()),
+        pa.array(points.ravel())
+    )
+    rings = pa.ListArray.from_arrays(
+        pa.array(feature_offsets, type = pa.int32()),
+        pa.array(np.diff(ring_offsets))
+    )
+    columns = {
+        id_column: pa.array(
+            [feature.get("id") for feature in features], type = pa.string()
+        ),
+        wkb_column: pa.array(list(sp.to_wkb(shapes)), type = pa.binary()),
+        coordinates_column: coordinates,
+        rings_column: rings,
+    }
+    for name in properties.column_names:
+        if name not in columns:
+            columns[name] = properties.column(name)
+    return pa.table(columns)
+# ============================================================================ #
+
+
+
+# ================================== CACHE =================================== #
+# Écrit atomiquement une table dans le cache
+def write_table(table, filename):
+    directory, name = os.path.split(filename)
+    os.makedirs(directory, exist_ok = True)
+    temporary = os.path.join(directory, "." + name + "." + str(os.getpid()))
+    with pa.OSFile(temporary, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary, filename)
+# ---------------------------------------------------------------------------- #
+# Lit une table du cache par projection mémoire
+def read_table(filename):
+    source = pa.memory_map(filename, "r")
+    return pa.ipc.open_file(source).read_all()
+# ---------------------------------------------------------------------------- #
+# Supprime les entrées les moins récemment utilisées au delà de la taille limite
+def evict(directory = None, size = cache_size):
+    directory = directory if (directory) else get_cache_directory()
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if (name.endswith(".arrow") and os.path.isfile(path)):
+            status = os.stat(path)
+            entries.append((status.st_mtime, status.st_size, path))
+    total = sum([entry[1] for entry in entries])
+    for mtime, length, path in sorted(entries):
+        if (total <= size):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= length
+    return total
+# ---------------------------------------------------------------------------- #
+# Charge un fichier json du cadastre en passant par le cache
+def load_features(filename, directory = None, size = cache_size):
+    cache_file = get_cache_file(filename, directory)
+    # Si le fichier est dans le cache, le marque comme récemment utilisé
+    if (os.path.exists(cache_file)):
+        try:
+            table = read_table(cache_file)
+            os.utime(cache_file)
+            return Features(table)
+        except (OSError, pa.ArrowInvalid):
+            pass
+    # Sinon, lit le json par lots et l'ajoute au cache
+    tables = [
+        make_table(batch)
+        for batch in streaming.iterate_batches(filename, parse_batch_size)
+    ]
+    if (tables):
+        table = pa.concat_tables(tables, promote_options = "permissive")
+    else:
+        table = make_table([])
+    write_table(table, cache_file)
+    table = read_table(cache_file)
+    evict(os.path.dirname(cache_file), size)
+    return Features(table)
+# ============================================================================ #
@@ -0,0 +1,250 @@
+# =================================== CLI ==================================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         cli.py
+# Description :     Ligne de commande, qui n'importe que le module utilisé
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import sys
+import argparse
+import importlib
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Importe un module du projet au moment de l'exécution d'une commande
+def load(name):
+    return importlib.import_module("." + name, __package__)
+# ---------------------------------------------------------------------------- #
+# Retourne les options données, les autres gardant la valeur par défaut des
+# fonctions appelées
+def get_options(arguments, names):
+    options = {name: getattr(arguments, name) for name in names}
+    return {name: value for name, value in options.items() if value is not None}
+# ---------------------------------------------------------------------------- #
+# Code de retour selon les échecs d'une commande
+def get_status(failures):
+    return 1 if (failures) else 0
+# ============================================================================ #
+
+
+
+# ================================= COMMANDES ================================ #
+# Retourne le dossier racine des fichiers du cadastre etalab
+def get_cadastre_root(installer):
+    return installer.link_etalab_cadastre.strip("/").rpartition("/")[2]
+# ---------------------------------------------------------------------------- #
+# Explore le cadastre etalab et sauvegarde la liste des fichiers
+def run_install(arguments):
+    installer = load("installer")
+    files = installer.explore_etalab_cadastre(**get_options(
+        arguments, ["link", "version", "extension", "level", "processes"]
+    ))
+    root = get_cadastre_root(installer)
+    filename = installer.save_list(files, root, arguments.filename)
+    print(len(files), "fichiers :", filename)
+    return 0
+# ---------------------------------------------------------------------------- #
+# Télécharge les fichiers d'une liste sauvegardée
+def run_download(arguments):
+    installer = load("installer")
+    options = get_options(
+        arguments, ["filename", "root", "processes", "decompress"]
+    )
+    options.setdefault("root", get_cadastre_root(installer))
+    return get_status(installer.download_saved_list(**options))
+# ---------------------------------------------------------------------------- #
+# Construit l'index départemental des bâtiments
+def run_index(arguments):
+    indexer = load("indexer")
+    return get_status(indexer.build_index(**get_options(
+        arguments, ["departments", "root", "directory", "processes"]
+    )))
+# ---------------------------------------------------------------------------- #
+# Construit l'index départemental des parcelles
+def run_parcels(arguments):
+    parcels = load("parcels")
+    return get_status(parcels.build_parcels_index(**get_options(
+        arguments, ["departments", "root", "directory", "processes"]
+    )))
+# ---------------------------------------------------------------------------- #
+# Analyse les communes du cadastre
+def run_enhance(arguments):
+    enhancer = load("enhancer")
+    return get_status(enhancer.enhance_cities(**get_options(
+        arguments,
+        ["cities", "root", "output", "processes", "index", "report", "profile"]
+    )))
+# ---------------------------------------------------------------------------- #
+# Pretraite les fichiers dvf, entièrement ou seulement ceux qui ont changé
+def run_preprocess(arguments):
+    analyzer = load("analyzer")
+    options = get_options(arguments, [
+        "filename", "stream", "block_size", "processes", "report", "profile"
+    ])
+    if (arguments.incremental):
+        updated, reused, removed = analyzer.refresh_preprocessed_file(**options)
+        print(
+            "Fichiers mis à jour :", len(updated), "| réutilisés :",
+            len(reused), "| retirés :", len(removed)
+        )
+    else:
+        analyzer.save_preprocessed_file(**options)
+    return 0
+# ---------------------------------------------------------------------------- #
+# Calcule les statistiques de prix au m²
+def run_statistics(arguments):
+    prices = load("prices")
+    prices.build_statistics(**get_options(arguments, ["levels", "directory"]))
+    return 0
+# ---------------------------------------------------------------------------- #
+# Mesure les performances sur des données synthétiques
+def run_benchmark(arguments):
+    benchmark = load("benchmark")
+    return get_status(benchmark.main(**get_options(
+        arguments, ["size", "rows", "filename", "startup"]
+    )))
+# ============================================================================ #
+
+
+
+# ================================ ARGUMENTS ================================= #
+# Ajoute les options communes aux commandes parallèles
+def add_processes(parser):
+    parser.add_argument(
+        "--processes", type = int, help = "nombre de processus ou de threads"
+    )
+# ---------------------------------------------------------------------------- #
+# Ajoute les options des commandes de construction d'index
+def add_index_options(parser):
+    parser.add_argument(
+        "--departments", nargs = "+", help = "départements à traiter"
+    )
+    parser.add_argument("--root", help = "dossier des communes du cadastre")
+    parser.add_argument("--directory", help = "dossier de l'index")
+    add_processes(parser)
+# ---------------------------------------------------------------------------- #
+# Ajoute les options de mesure des performances
+def add_profiler_options(parser):
+    parser.add_argument(
+        "--report", help = "rapport de mesures par étape (.json ou .csv)"
+    )
+    parser.add_argument(
+        "--profile", help = "dossier des profils cProfile par unité de travail"
+    )
+# ---------------------------------------------------------------------------- #
+# Construit l'analyseur de la ligne de commande
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog = "analyse-cadastre-dvf",
+        description = "Analyse des prix de l'immobilier par le cadastre et "
+        "les données DVF ouvertes"
+    )
+    commands = parser.add_subparsers(metavar = "commande")
+    # Installation
+    command = commands.add_parser(
+        "install", help = "liste les fichiers du cadastre etalab"
+    )
+    command.add_argument("--link", help = "adresse du cadastre etalab")
+    command.add_argument("--version", help = "version du cadastre")
+    command.add_argument("--extension", help = "format des fichiers")
+    command.add_argument("--level", help = "niveau de découpage")
+    command.add_argument("--filename", help = "fichier de la liste")
+    add_processes(command)
+    command.set_defaults(function = run_install)
+    # Téléchargement
+    command = commands.add_parser(
+        "download", help = "télécharge les fichiers d'une liste"
+    )
+    command.add_argument("filename", help = "fichier de la liste")
+    command.add_argument("--root", help = "dossier racine des fichiers")
+    command.add_argument(
+        "--compressed", dest = "decompress", action = "store_false",
+        default = None, help = "garde les fichiers gzip compressés"
+    )
+    add_processes(command)
+    command.set_defaults(function = run_download)
+    # Index
+    command = commands.add_parser(
+        "index", help = "construit l'index départemental des bâtiments"
+    )
+    add_index_options(command)
+    command.set_defaults(function = run_index)
+    command = commands.add_parser(
+        "parcels", help = "construit l'index départemental des parcelles"
+    )
+    add_index_options(command)
+    command.set_defaults(function = run_parcels)
+    # Analyse du cadastre
+    command = commands.add_parser(
+        "enhance", help = "analyse les parcelles et bâtiments des communes"
+    )
+    command.add_argument("--cities", nargs = "+", help = "codes insee")
+    command.add_argument("--root", help = "dossier des communes du cadastre")
+    command.add_argument("--output", help = "dossier des résultats")
+    command.add_argument("--index", help = "dossier de l'index des bâtiments")
+    add_processes(command)
+    add_profiler_options(command)
+    command.set_defaults(function = run_enhance)
+    # Prétraitement des dvf
+    command = commands.add_parser(
+        "preprocess", help = "pretraite les fichiers dvf"
+    )
+    command.add_argument("--filename", help = "dossier des ventes pretraitées")
+    command.add_argument(
+        "--stream", action = "store_true", help = "lit les fichiers par blocs"
+    )
+    command.add_argument(
+        "--block-size", type = int, help = "taille des blocs en octets"
+    )
+    command.add_argument(
+        "--incremental", action = "store_true",
+        help = "ne traite que les fichiers nouveaux ou modifiés"
+    )
+    add_processes(command)
+    add_profiler_options(command)
+    command.set_defaults(function = run_preprocess)
+    # Statistiques de prix
+    command = commands.add_parser(
+        "statistics", help = "calcule les statistiques de prix au m²"
+    )
+    command.add_argument("--levels", nargs = "+", help = "niveaux d'agrégation")
+    command.add_argument("--directory", help = "dossier des statistiques")
+    command.set_defaults(function = run_statistics)
+    # Mesures de performances
+    command = commands.add_parser(
+        "benchmark", help = "mesure les performances sur des données générées"
+    )
+    command.add_argument("--size", type = int, help = "lots par côté")
+    command.add_argument("--rows", type = int, help = "lignes dvf")
+    command.add_argument("--filename", help = "fichier de référence")
+    command.add_argument(
+        "--startup", action = "store_true",
+        help = "ne mesure que le temps de démarrage"
+    )
+    command.set_defaults(function = run_benchmark)
+    return parser
+# ============================================================================ #
+
+
+
+# ================================= PROGRAMME ================================ #
+# Programme principal
+def main(arguments = None):
+    parser = make_parser()
+    arguments = parser.parse_args(arguments)
+    if (not hasattr(arguments, "function")):
+        parser.print_help()
+        return 2
+    return arguments.function(arguments)
+# ---------------------------------------------------------------------------- #
+if __name__ == "__main__":
+    sys.exit(main())
+# ============================================================================ #
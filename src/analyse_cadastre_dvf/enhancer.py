@@ -0,0 +1,788 @@
+# ================================= ENHANCER ================================= #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         enhancer.py
+# Description :     Augmentation des données par analyse du cadastre
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import re
+import sys
+import copy
+import gzip
+import json
+import time
+import base64
+import shutil
+import tarfile
+import collections
+import multiprocessing
+import collections.abc
+# Aliases
+import numpy as np
+import pyarrow as pa
+import shapely as sp
+import datetime as dt
+import shapely.geometry as geom
+import shapely.ops as spops
+import shapely.affinity as spaff
+import shapely.strtree as sptree
+import pyarrow.feather as pafeather
+import xml.etree.ElementTree as et
+# Modules
+from datetime import datetime
+from geographiclib.geodesic import Geodesic
+from geographiclib.polygonarea import PolygonArea
+# Projet
+from . import cache
+from . import indexer
+from . import metrics
+from . import profiler
+from . import streaming
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Dossiers
+root_directory = "analyse-cadastre-dvf"
+cadastre_directory = "etalab-cadastre"
+enhanced_directory = "enhanced"
+# Version du cadastre
+cadastre_version = "2017-07-06"
+# Cache binaire des fichiers json
+use_cache = True
+# Index départemental des bâtiments à la place d'un arbre par ville
+use_index = False
+# Nombre d'éléments traités à la fois en lecture incrémentale
+batch_size = 10000
+# Marge relative du pré-filtrage des aires par estimation planaire
+area_margin = 0.01
+# Types de fichiers d'une ville
+city_kinds = ["batiments", "communes", "feuilles", "parcelles", "sections"]
+# Parallélisation
+workers = os.cpu_count()
+progress_interval = 100
+# Schéma de la table des parcelles augmentées
+enhanced_schema = pa.schema([
+    ("id", pa.string()),
+    ("commune", pa.string()),
+    ("land_area", pa.float64()),
+    ("land_perimeter", pa.float64()),
+    ("land_rectangle_min", pa.float64()),
+    ("land_rectangle_max", pa.float64()),
+    ("land_ratio", pa.float64()),
+    ("buildings", pa.int32()),
+    ("merged_area", pa.float64()),
+    ("building_area", pa.float64()),
+    ("largest_building_area", pa.float64()),
+])
+# ============================================================================ #
+
+
+
+# ================================= DOSSIERS ================================= #
+# Trouves le nom de dossier complet pour les données
+def get_data_directory(root = root_directory):
+    current = os.path.realpath('.')
+    path = current.partition(root)[0] + os.sep + root + os.sep + "data" + os.sep
+    return path
+# ============================================================================ #
+
+
+
+# ================================= DONNEES ================================== #
+# Retourne le nom d'un fichier json du cadastre
+def get_filename(directory, code, kind):
+    filename = directory.rstrip("/") + "/" + "cadastre-" + str(code) + "-"
+    filename += kind + ".json"
+    return filename
+# ---------------------------------------------------------------------------- #
+# Charge un fichier json du cadastre
+def load_file(directory, code, kind, cached = None):
+    filename = get_filename(directory, code, kind)
+    if (use_cache if (cached is None) else cached):
+        return cache.load_features(filename)
+    with open(filename) as stream:
+        features = json.load(stream)["features"]
+    return features
+# ---------------------------------------------------------------------------- #
+# Lit un fichier json du cadastre élément par élément ou par lots
+def stream_file(directory, code, kind, size = None, cached = None):
+    filename = get_filename(directory, code, kind)
+    if (use_cache if (cached is None) else cached):
+        features = cache.load_features(filename)
+        return features.batches(size) if (size) else iter(features)
+    elif (size):
+        return streaming.iterate_batches(filename, size)
+    else:
+        return streaming.iterate_features(filename)
+# ---------------------------------------------------------------------------- #
+# Retourne le dossier contenant les communes du cadastre
+def get_cadastre_directory(version = cadastre_version):
+    directory = get_data_directory().rstrip("/") + "/"
+    directory += cadastre_directory + "/"
+    directory += version + "/" + "geojson" + "/" + "communes" + "/"
+    directory = directory.replace("//", "/")
+    return directory
+# ---------------------------------------------------------------------------- #
+# Retourne le département d'une ville à partir de son code insee
+def get_city_department(insee):
+    code = str(insee)
+    department = code[0:3] if (code.startswith("97")) else code[0:2]
+    return department
+# ---------------------------------------------------------------------------- #
+# Retourne le dossier contenant les données d'une ville
+def get_city_directory(insee, root = None):
+    code = str(insee)
+    directory = (root if (root) else get_cadastre_directory()).rstrip("/")
+    directory += "/" + get_city_department(code) + "/" + code + "/"
+    directory = directory.replace("//", "/")
+    return directory
+# ---------------------------------------------------------------------------- #
+# Données d'une ville chargées à la demande lors du premier accès
+class City(collections.abc.Mapping):
+    # Constructeur
+    def __init__(self, directory, code, kinds = city_kinds):
+        self.directory = directory
+        self.code = code
+        self.kinds = [kind for kind in city_kinds if kind in kinds]
+        self.files = {}
+    # Accès aux données d'un type de fichier
+    def __getitem__(self, kind):
+        if (kind not in self.kinds):
+            raise KeyError(kind)
+        if (kind not in self.files):
+            self.files[kind] = load_file(self.directory, self.code, kind)
+        return self.files[kind]
+    # Itération sur les types de fichiers
+    def __iter__(self):
+        return iter(self.kinds)
+    # Nombre de types de fichiers
+    def __len__(self):
+        return len(self.kinds)
+    # Lit les données d'un type de fichier sans les garder en mémoire
+    def stream(self, kind, size = None):
+        if (kind not in self.kinds):
+            raise KeyError(kind)
+        if (kind in self.files):
+            features = self.files[kind]
+            if (not size):
+                return iter(features)
+            elif (hasattr(features, "batches")):
+                return features.batches(size)
+            else:
+                return (
+                    features[i:i + size] for i in range(0, len(features), size)
+                )
+        return stream_file(self.directory, self.code, kind, size)
+# ---------------------------------------------------------------------------- #
+# Charge les données liées à une ville
+def load_city(insee, root = None, kinds = city_kinds):
+    code = str(insee)
+    directory = get_city_directory(code, root)
+    return City(directory, code, kinds)
+# ---------------------------------------------------------------------------- #
+# Trouve les codes insee de toutes les villes présentes dans le cadastre
+def find_cities(root = None):
+    directory = (root if (root) else get_cadastre_directory()).rstrip("/")
+    cities = []
+    for department in sorted(os.listdir(directory)):
+        path = directory + "/" + department
+        if (os.path.isdir(path)):
+            cities += [
+                code for code in sorted(os.listdir(path))
+                if os.path.isdir(path + "/" + code)
+            ]
+    return cities
+# ---------------------------------------------------------------------------- #
+# Itère sur les éléments json d'une liste, d'un flux ou d'un flux de lots
+def iterate_features(json):
+    for element in json:
+        if (isinstance(element, dict)):
+            yield element
+        else:
+            yield from element
+# ---------------------------------------------------------------------------- #
+# Retourne les identifiants d'une liste, d'un flux ou d'un flux de lots
+def get_ids(json):
+    if (hasattr(json, "ids")):
+        return json.ids()
+    ids = []
+    for element in json:
+        if (isinstance(element, dict)):
+            ids.append(element["id"])
+        else:
+            ids += get_ids(element)
+    return ids
+# ---------------------------------------------------------------------------- #
+# Retourne les géométries shapely d'une liste, d'un flux ou d'un flux de lots
+def get_shapes(json):
+    if (hasattr(json, "shapes")):
+        return json.shapes()
+    shapes = []
+    for element in json:
+        if (isinstance(element, dict)):
+            shapes.append(geom.shape(element["geometry"]))
+        else:
+            shapes += get_shapes(element)
+    return shapes
+# ---------------------------------------------------------------------------- #
+# Créé un tableau associatif associant un numero de parcelle a un element json
+def make_land_mapping(json):
+    mapping = {}
+    for land in iterate_features(json):
+        mapping[land["id"]] = land
+    return mapping
+# ---------------------------------------------------------------------------- #
+# Créé un arbre pour l'analyse des bâtiments
+def make_buildings_tree(json):
+    shapes = sp.buffer(np.array(get_shapes(json), dtype = object), 0)
+    return sptree.STRtree(shapes)
+# ============================================================================ #
+
+
+
+# ================================= POLYGONE ================================= #
+# Defini un polygone et calcule ses propriétés à la demande
+class Polygon:
+    # Attributs
+    __slots__ = (
+        "polygon",
+        "cached_centroid",
+        "cached_rectangle",
+        "cached_perimeter",
+        "cached_area",
+        "cached_rectangle_min",
+        "cached_rectangle_max",
+        "cached_rectangle_perimeter",
+        "cached_rectangle_area",
+    )
+    # Constructeur
+    def __init__(self, poly):
+        self.polygon = poly
+        self.cached_centroid = None
+        self.cached_rectangle = None
+        self.cached_perimeter = None
+        self.cached_area = None
+        self.cached_rectangle_min = None
+        self.cached_rectangle_max = None
+        self.cached_rectangle_perimeter = None
+        self.cached_rectangle_area = None
+    # Calcule l'aire et le périmètre géodésiques du polygone
+    def measure_polygon(self):
+        points_lon_lat = list(self.polygon.exterior.coords)
+        geopoly = PolygonArea(Geodesic.WGS84)
+        for point in points_lon_lat[0:-1]:
+            geopoly.AddPoint(point[1], point[0])
+        geopoly_result = geopoly.Compute()
+        self.cached_perimeter = abs(geopoly_result[1])
+        self.cached_area = abs(geopoly_result[2])
+    # Calcule l'aire, le périmètre et les dimensions géodésiques du rectangle
+    def measure_rectangle(self):
+        # Converti le rectangle en liste de points
+        rpoints_lon_lat = list(self.rectangle.exterior.coords)
+        rpoints_lat_lon = [(point[1], point[0]) for point in rpoints_lon_lat]
+        # Converti le rectangle dans la bonne projection
+        wgs84 = Geodesic.WGS84
+        georectangle = PolygonArea(wgs84)
+        for point in rpoints_lat_lon[0:-1]:
+            georectangle.AddPoint(point[0], point[1])
+        georectangle_result = georectangle.Compute()
+        # Calcule les dimensions du rectangle
+        rdistance = []
+        for i in range(0, 4):
+            rdistance.append(wgs84.Inverse(
+                rpoints_lat_lon[i % 4][0],
+                rpoints_lat_lon[i % 4][1],
+                rpoints_lat_lon[(i + 1) % 4][0],
+                rpoints_lat_lon[(i + 1) % 4][1]
+            )["s12"])
+        rdistance = [
+            abs((rdistance[0] + rdistance[2])/2.0),
+            abs((rdistance[1] + rdistance[3])/2.0)
+        ]
+        self.cached_rectangle_min = min(rdistance)
+        self.cached_rectangle_max = max(rdistance)
+        self.cached_rectangle_perimeter = abs(georectangle_result[1])
+        self.cached_rectangle_area = abs(georectangle_result[2])
+    # Centre du polygone
+    @property
+    def centroid(self):
+        if (self.cached_centroid is None):
+            self.cached_centroid = self.polygon.centroid
+        return self.cached_centroid
+    # Rectangle minimal contenant le polygone
+    @property
+    def rectangle(self):
+        if (self.cached_rectangle is None):
+            self.cached_rectangle = self.polygon.minimum_rotated_rectangle
+        return self.cached_rectangle
+    # Périmètre géodésique
+    @property
+    def perimeter(self):
+        if (self.cached_perimeter is None):
+            self.measure_polygon()
+        return self.cached_perimeter
+    # Aire géodésique, sans calcul du rectangle
+    @property
+    def area(self):
+        if (self.cached_area is None):
+            self.measure_polygon()
+        return self.cached_area
+    # Plus petite dimension du rectangle
+    @property
+    def rectangle_min(self):
+        if (self.cached_rectangle_min is None):
+            self.measure_rectangle()
+        return self.cached_rectangle_min
+    # Plus grande dimension du rectangle
+    @property
+    def rectangle_max(self):
+        if (self.cached_rectangle_max is None):
+            self.measure_rectangle()
+        return self.cached_rectangle_max
+    # Périmètre géodésique du rectangle
+    @property
+    def rectangle_perimeter(self):
+        if (self.cached_rectangle_perimeter is None):
+            self.measure_rectangle()
+        return self.cached_rectangle_perimeter
+    # Aire géodésique du rectangle
+    @property
+    def rectangle_area(self):
+        if (self.cached_rectangle_area is None):
+            self.measure_rectangle()
+        return self.cached_rectangle_area
+    # Compacité du polygone par rapport à son rectangle
+    @property
+    def ratio(self):
+        return self.area / self.rectangle_area
+    # Facteur de conversion de l'aire du polygone en mètres carrés
+    @property
+    def polygon_conversion(self):
+        return self.area / self.polygon.area
+    # Facteur de conversion de l'aire du rectangle en mètres carrés
+    @property
+    def rectangle_conversion(self):
+        return self.rectangle_area / self.rectangle.area
+    # Nombre de sommets
+    @property
+    def nvertices(self):
+        return len(self.polygon.exterior.coords) - 1
+    # Nombre d'arêtes
+    @property
+    def nedges(self):
+        return self.nvertices
+    # Retourne une version agrandie approximée du polygone
+    def scaled(self, distance = 1):
+        new_area = self.area + self.perimeter * distance
+        new_area += self.nvertices * distance * distance
+        ratio = new_area / self.area
+        scaling = ratio ** (1./2.)
+        new_polygon = spaff.scale(
+            self.polygon,
+            xfact = scaling,
+            yfact = scaling,
+            origin = "centroid"
+        )
+        return Polygon(new_polygon)
+# ============================================================================ #
+
+
+
+# ================================= ANALYSE ================================== #
+# Analyse les données cadastrales d'une parcelle
+def land_analyzer(name, json, mapping = None):
+    # Initialisation
+    land_json = None
+    # Récupération du json de la parcelle
+    if (mapping):
+        land_json = mapping[name]
+    else:
+        for element in json:
+            if (element["id"] == name):
+                land_json = element
+                break
+    # Si la parcelle a été trouvée
+    if (land_json):
+        land_shape = geom.shape(land_json["geometry"])
+        polygon = Polygon(land_shape)
+        print(polygon.rectangle_min, polygon.rectangle_max, polygon.rectangle_min*polygon.rectangle_max, polygon.rectangle_area)
+# -----------------------------------------------------------------------------#
+# Trouve les batiments qui intersectent une parcelle
+def find_buildings_on_land(land_polygon, buildings_tree):
+    intersecting = []
+    if (type(buildings_tree) != list):
+        query = buildings_tree.query(land_polygon)
+        for building_polygon in buildings_tree.geometries.take(query):
+            if (building_polygon.intersects(land_polygon)):
+                intersecting.append(building_polygon)
+    else:
+        for building in buildings_tree:
+            building_polygon = geom.shape(building["geometry"])
+            if (building_polygon.intersects(land_polygon)):
+                intersecting.append(building_polygon)
+    return intersecting
+# -----------------------------------------------------------------------------#
+# Merge les batiments qui ont une frontiere commune
+def merge_buildings(buildings_list, paths = None):
+    output = buildings_list
+    if (buildings_list and len(buildings_list) > 0):
+        # Si les emprises ne se touchent pas, la fusion est inutile
+        if (len(buildings_list) == 1 or not overlapping_bounds(buildings_list)):
+            output = list(sp.get_parts(buildings_list))
+            path = "single" if (len(buildings_list) == 1) else "disjoint"
+        else:
+            output = spops.unary_union(buildings_list)
+            if (type(output) == geom.multipolygon.MultiPolygon):
+                output = list(output.geoms)
+            elif (type(output) == geom.polygon.Polygon):
+                output = [output]
+            else:
+                print("ERROR")
+            path = "union"
+    else:
+        path = "none"
+    if (paths is not None):
+        paths[path] += 1
+    return output
+# -----------------------------------------------------------------------------#
+# Teste si au moins deux géométries d'une liste ont des emprises qui se touchent
+def overlapping_bounds(geometries):
+    bounds = sp.bounds(np.asarray(geometries, dtype = object))
+    overlap = (bounds[:, None, 0] <= bounds[None, :, 2])
+    overlap &= (bounds[:, None, 2] >= bounds[None, :, 0])
+    overlap &= (bounds[:, None, 1] <= bounds[None, :, 3])
+    overlap &= (bounds[:, None, 3] >= bounds[None, :, 1])
+    np.fill_diagonal(overlap, False)
+    return bool(np.any(overlap))
+# -----------------------------------------------------------------------------#
+# Sélectionne les géométries d'aire supérieure au seuil en ne calculant l'aire
+# géodésique que lorsque l'estimation planaire est proche du seuil
+def threshold_areas(geometries, threshold, paths = None):
+    estimates = metrics.estimate_geometries_areas(geometries)
+    kept = estimates > threshold * (1. + area_margin)
+    uncertain = ~kept & (estimates > threshold * (1. - area_margin))
+    if (np.any(uncertain)):
+        areas = metrics.compute_geometries_areas(
+            np.asarray(geometries, dtype = object)[uncertain]
+        )
+        kept[uncertain] = areas > threshold
+    if (paths is not None):
+        paths["planar"] += len(estimates) - int(np.sum(uncertain))
+        paths["geodesic"] += int(np.sum(uncertain))
+    return kept
+# -----------------------------------------------------------------------------#
+# Découpe la partie des bâtiments qui intersecte le terrain
+def crop_buildings(land_polygon, buildings_list, threshold = 1, paths = None):
+    output = buildings_list
+    if (buildings_list and len(buildings_list) > 0):
+        tmp = [x.intersection(land_polygon) for x in buildings_list]
+        tmp = [
+            x for x in tmp if (
+                type(x) == geom.polygon.Polygon
+                or type(x) == geom.multipolygon.MultiPolygon
+            )
+        ]
+        pieces = list(sp.get_parts(tmp))
+        kept = threshold_areas(pieces, threshold, paths)
+        output = [b for b, keep in zip(pieces, kept) if keep]
+    return output
+# -----------------------------------------------------------------------------#
+# Trouve en bloc les paires (parcelle, bâtiment) qui s'intersectent
+def query_lands_buildings(land_shapes, buildings_tree):
+    land_shapes = np.asarray(land_shapes, dtype = object)
+    pairs = buildings_tree.query(land_shapes, predicate = "intersects")
+    order = np.lexsort((pairs[1], pairs[0]))
+    land_index = pairs[0][order].astype(np.int64)
+    building_index = pairs[1][order].astype(np.int64)
+    return land_index, building_index
+# -----------------------------------------------------------------------------#
+# Calcule en bloc les paires (parcelle, bâtiment) et les aires découpées
+def join_lands_buildings(land_shapes, buildings_tree):
+    land_shapes = np.asarray(land_shapes, dtype = object)
+    land_index, building_index = query_lands_buildings(
+        land_shapes, buildings_tree
+    )
+    buildings = buildings_tree.geometries.take(building_index)
+    cropped = sp.intersection(buildings, land_shapes[land_index])
+    areas = metrics.compute_geometries_areas(cropped)
+    return land_index, building_index, areas
+# -----------------------------------------------------------------------------#
+# Fusionne en bloc les bâtiments associés à chaque parcelle et retourne pour
+# chaque géométrie fusionnée l'indice de sa parcelle
+def merge_buildings_bulk(land_index, buildings, nlands, paths = None):
+    # Nombre de bâtiments par parcelle
+    counts = np.bincount(land_index, minlength = nlands)
+    multiple = counts[land_index] > 1
+    # Parcelles dont les emprises de bâtiments se touchent : fusion nécessaire
+    union = np.zeros(nlands, dtype = bool)
+    if (np.any(multiple)):
+        candidates = np.nonzero(multiple)[0]
+        boxes = sp.box(*sp.bounds(buildings[candidates]).T)
+        pairs = sp.STRtree(boxes).query(boxes)
+        lands = land_index[candidates]
+        same = (pairs[0] != pairs[1]) & (lands[pairs[0]] == lands[pairs[1]])
+        union[lands[pairs[0][same]]] = True
+    # Bâtiments conservés tels quels
+    direct = ~union[land_index]
+    merged_lands = [land_index[direct]]
+    merged = [buildings[direct]]
+    # Fusion ligne par ligne des bâtiments des autres parcelles
+    fused = union[land_index]
+    if (np.any(fused)):
+        groups, inverse = np.unique(land_index[fused], return_inverse = True)
+        starts = np.searchsorted(land_index[fused], groups)
+        rank = np.arange(len(inverse)) - starts[inverse]
+        padded = np.full((len(groups), rank.max() + 1), None, dtype = object)
+        padded[inverse, rank] = buildings[fused]
+        merged_lands.append(groups)
+        merged.append(sp.union_all(padded, axis = 1))
+    # Statistiques des chemins
+    if (paths is not None):
+        paths["none"] += int(np.sum(counts == 0))
+        paths["single"] += int(np.sum(counts == 1))
+        paths["disjoint"] += int(np.sum((counts > 1) & ~union))
+        paths["union"] += int(np.sum(union))
+    return np.concatenate(merged_lands), np.concatenate(merged)
+# -----------------------------------------------------------------------------#
+# Découpe en bloc les bâtiments fusionnés par leur parcelle
+def crop_buildings_bulk(land_shapes, merged, threshold = 1, paths = None):
+    cropped = sp.intersection(merged, land_shapes)
+    pieces, index = sp.get_parts(cropped, return_index = True)
+    polygons = sp.get_type_id(pieces) == 3
+    pieces = pieces[polygons]
+    index = index[polygons]
+    # Élimine les éclats sans calcul géodésique
+    estimates = metrics.estimate_geometries_areas(pieces)
+    candidates = estimates > threshold * (1. - area_margin)
+    pieces = pieces[candidates]
+    index = index[candidates]
+    areas = metrics.compute_geometries_areas(pieces)
+    kept = areas > threshold
+    if (paths is not None):
+        paths["planar"] += int(np.sum(~candidates))
+        paths["geodesic"] += len(areas)
+    return index[kept], pieces[kept], areas[kept]
+# -----------------------------------------------------------------------------#
+# Tri une liste de polygones par taille
+def sort_polygons(polygons_list):
+    areas = metrics.compute_geometries_areas(polygons_list)
+    order = np.argsort(-areas, kind = "stable")
+    output = [polygons_list[i] for i in order]
+    return output
+# ============================================================================ #
+
+
+
+# ================================= PIPELINE ================================= #
+# Retourne le dossier des résultats partitionnés par département
+def get_enhanced_directory(root = None):
+    directory = root if (root) else get_data_directory() + enhanced_directory
+    directory = (directory.rstrip("/") + "/").replace("//", "/")
+    return directory
+# ---------------------------------------------------------------------------- #
+# Retourne le nom du fichier de résultats d'une ville
+def get_enhanced_file(insee, root = None):
+    code = str(insee)
+    filename = get_enhanced_directory(root) + get_city_department(code) + "/"
+    filename += code + ".feather"
+    return filename
+# ---------------------------------------------------------------------------- #
+# Analyse un lot de parcelles et retourne leurs propriétés en colonnes
+def enhance_lands(lands, buildings_tree, threshold = 1, paths = None):
+    # Initialisation
+    with profiler.stage("land_shapes"):
+        land_shapes = np.asarray(get_shapes(lands), dtype = object)
+    nlands = len(land_shapes)
+    with profiler.stage("land_metrics", nlands):
+        land_metrics = metrics.compute_features_metrics(lands)
+    profiler.count("land_shapes", nlands)
+    # Fusion et découpe des bâtiments en bloc
+    with profiler.stage("query_buildings"):
+        land_index, building_index = query_lands_buildings(
+            land_shapes, buildings_tree
+        )
+        buildings = buildings_tree.geometries.take(building_index)
+    profiler.count("query_buildings", len(building_index))
+    with profiler.stage("merge_buildings", len(buildings)):
+        merged_lands, merged = merge_buildings_bulk(
+            land_index, buildings, nlands, paths
+        )
+    with profiler.stage("crop_buildings", len(merged)):
+        cropped_index, cropped, cropped_areas = crop_buildings_bulk(
+            land_shapes[merged_lands], merged, threshold, paths
+        )
+        cropped_index = merged_lands[cropped_index]
+    # Calcule les surfaces bâties
+    with profiler.stage("building_areas", len(merged)):
+        merged_parts, merged_index = sp.get_parts(merged, return_index = True)
+        merged_areas = metrics.compute_geometries_areas(merged_parts)
+        merged_index = merged_lands[merged_index]
+    largest = np.zeros(nlands)
+    np.maximum.at(largest, cropped_index, cropped_areas)
+    # Retourne les colonnes
+    return {
+        "id": get_ids(lands),
+        "land_area": land_metrics["area"],
+        "land_perimeter": land_metrics["perimeter"],
+        "land_rectangle_min": land_metrics["rectangle_min"],
+        "land_rectangle_max": land_metrics["rectangle_max"],
+        "land_ratio": land_metrics["ratio"],
+        "buildings": np.bincount(cropped_index, minlength = nlands),
+        "merged_area": np.bincount(
+            merged_index, weights = merged_areas, minlength = nlands
+        ),
+        "building_area": np.bincount(
+            cropped_index, weights = cropped_areas, minlength = nlands
+        ),
+        "largest_building_area": largest,
+    }
+# ---------------------------------------------------------------------------- #
+# Analyse toutes les parcelles d'une ville et retourne une table par parcelle
+def enhance_city(
+    insee,
+    root = None,
+    size = batch_size,
+    index = None,
+    paths = None
+):
+    city = load_city(insee, root, ["parcelles", "batiments"])
+    with profiler.stage("buildings_tree"):
+        if (index or use_index):
+            buildings_tree = indexer.open_index(index)
+        else:
+            buildings_tree = make_buildings_tree(profiler.iterate(
+                "read_buildings", city.stream("batiments", size)
+            ))
+    if (size):
+        batches = city.stream("parcelles", size)
+    else:
+        batches = [city["parcelles"]]
+    tables = []
+    for lands in profiler.iterate("read_lands", batches):
+        columns = enhance_lands(lands, buildings_tree, paths = paths)
+        columns["commune"] = [str(insee)] * len(columns["id"])
+        tables.append(pa.Table.from_pydict(columns, schema = enhanced_schema))
+    if (not tables):
+        return enhanced_schema.empty_table()
+    return pa.concat_tables(tables).combine_chunks()
+# ---------------------------------------------------------------------------- #
+# Sauvegarde atomiquement les résultats d'une ville
+def save_enhanced_city(table, filename):
+    directory, name = os.path.split(filename)
+    os.makedirs(directory, exist_ok = True)
+    temporary = os.path.join(directory, "." + name + ".tmp")
+    pafeather.write_feather(table, temporary, compression = "uncompressed")
+    os.replace(temporary, filename)
+# ---------------------------------------------------------------------------- #
+# Tâche d'un processus : analyse et sauvegarde une ville, avec les mesures du
+# processus si elles sont activées
+def enhance_city_task(arguments):
+    insee, root, output, index = arguments
+    paths = collections.Counter()
+    try:
+        with profiler.unit("commune", insee) as record:
+            table = enhance_city(insee, root, index = index, paths = paths)
+            with profiler.stage("save", table.num_rows):
+                save_enhanced_city(table, get_enhanced_file(insee, output))
+            record["items"] = table.num_rows
+        return insee, table.num_rows, paths, None, profiler.collect()
+    except Exception as error:
+        return insee, 0, paths, repr(error), profiler.collect()
+# ---------------------------------------------------------------------------- #
+# Analyse un ensemble de villes en parallèle en reprenant là où on s'est arrêté
+def enhance_cities(
+    cities = None,
+    root = None,
+    output = None,
+    processes = workers,
+    interval = progress_interval,
+    index = None,
+    report = None,
+    profile = None
+):
+    # Initialisation
+    profiled = report or profile
+    if (profiled):
+        profiler.enable(profile)
+    try:
+        cities = find_cities(root) if (cities is None) else cities
+        todo = [
+            code for code in cities
+            if not os.path.exists(get_enhanced_file(code, output))
+        ]
+        tasks = [(code, root, output, index) for code in todo]
+        failures = {}
+        paths = collections.Counter()
+        ncities = 0
+        nlands = 0
+        print(
+            "Villes :", len(cities),
+            "| déjà traitées :", len(cities) - len(todo)
+        )
+        # Traitement parallèle
+        start = time.perf_counter()
+        with multiprocessing.Pool(
+            processes, profiler.initialize_worker
+        ) as pool:
+            results = pool.imap_unordered(
+                enhance_city_task, tasks, chunksize = 1
+            )
+            for insee, count, city_paths, error, stats in results:
+                ncities += 1
+                nlands += count
+                paths.update(city_paths)
+                profiler.merge(stats)
+                if (error):
+                    failures[insee] = error
+                if (ncities % interval == 0 or ncities == len(tasks)):
+                    elapsed = max(time.perf_counter() - start, 1e-9)
+                    print(
+                        ncities, "/", len(tasks), "villes |",
+                        "%.2f villes/s |" % (ncities / elapsed),
+                        "%.1f parcelles/s |" % (nlands / elapsed),
+                        len(failures), "échecs"
+                    )
+        # Rapport des chemins de fusion et découpe
+        print(
+            "Parcelles sans bâtiment :", paths["none"],
+            "| un bâtiment :", paths["single"],
+            "| bâtiments disjoints :", paths["disjoint"],
+            "| fusion :", paths["union"]
+        )
+        print(
+            "Morceaux décidés par estimation planaire :", paths["planar"],
+            "| aires géodésiques calculées :", paths["geodesic"]
+        )
+        # Rapport des échecs
+        for insee, error in failures.items():
+            print("ERROR", insee, error)
+        # Rapport des mesures
+        if (report):
+            filenames = profiler.write_report(report)
+            print("Rapport de mesures :", ", ".join(filenames))
+        return failures
+    finally:
+        if (profiled):
+            profiler.disable()
+# ============================================================================ #
+
+
+
+# ================================= PROGRAMME ================================ #
+# Programme principal
+def main():
+    enhance_cities()
+# ---------------------------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
+# ============================================================================ #
@@ -0,0 +1,364 @@
+# ================================= INDEXER ================================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         indexer.py
+# Description :     Index spatial persistant des bâtiments par département
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import time
+import functools
+import multiprocessing
+# Aliases
+import numpy as np
+import pyarrow as pa
+import shapely as sp
+import shapely.geometry as geom
+# Projet
+from . import cache
+from . import streaming
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Dossiers
+root_directory = "analyse-cadastre-dvf"
+cadastre_directory = "etalab-cadastre"
+index_directory = "index"
+# Version du cadastre
+cadastre_version = "2017-07-06"
+# Cache binaire des fichiers json
+use_cache = True
+# Nombre d'éléments lus à la fois
+batch_size = 10000
+# Parallélisation
+workers = os.cpu_count()
+# Taille des tuiles de la grille nationale en degrés
+tile_size = 0.01
+grid_columns = int(round(360. / tile_size))
+# ============================================================================ #
+
+
+
+# ================================= DOSSIERS ================================= #
+# Trouves le nom de dossier complet pour les données
+def get_data_directory(root = root_directory):
+    current = os.path.realpath('.')
+    path = current.partition(root)[0] + os.sep + root + os.sep + "data" + os.sep
+    return path
+# ---------------------------------------------------------------------------- #
+# Retourne le dossier contenant les communes du cadastre
+def get_cadastre_directory(version = cadastre_version):
+    directory = get_data_directory().rstrip("/") + "/"
+    directory += cadastre_directory + "/"
+    directory += version + "/" + "geojson" + "/" + "communes" + "/"
+    directory = directory.replace("//", "/")
+    return directory
+# ---------------------------------------------------------------------------- #
+# Retourne le dossier contenant l'index des bâtiments
+def get_index_directory(version = cadastre_version):
+    directory = get_data_directory() + index_directory + "/" + version + "/"
+    directory = directory.replace("//", "/")
+    return directory
+# ---------------------------------------------------------------------------- #
+# Retourne le nom du fichier d'index d'un département
+def get_index_file(department, directory = None):
+    directory = directory if (directory) else get_index_directory()
+    filename = directory.rstrip("/") + "/batiments-" + str(department)
+    filename += ".arrow"
+    return filename
+# ---------------------------------------------------------------------------- #
+# Trouve les départements présents dans le cadastre
+def find_departments(root = None):
+    directory = (root if (root) else get_cadastre_directory()).rstrip("/")
+    departments = [
+        department for department in sorted(os.listdir(directory))
+        if os.path.isdir(directory + "/" + department)
+    ]
+    return departments
+# ---------------------------------------------------------------------------- #
+# Trouve les fichiers de bâtiments des communes d'un département
+def find_buildings_files(department, root = None):
+    directory = (root if (root) else get_cadastre_directory()).rstrip("/")
+    directory += "/" + str(department)
+    files = []
+    for code in sorted(os.listdir(directory)):
+        filename = directory + "/" + code + "/cadastre-" + code
+        filename += "-batiments.json"
+        if (os.path.isfile(filename)):
+            files.append((code, filename))
+    return files
+# ============================================================================ #
+
+
+
+# =============================== CONSTRUCTION =============================== #
+# Calcule les clés de tuiles de la grille nationale à partir de coordonnées
+def get_tile_keys(x, y):
+    column = np.floor((np.asarray(x) + 180.) / tile_size).astype(np.int64)
+    row = np.floor((np.asarray(y) + 90.) / tile_size).astype(np.int64)
+    return row * grid_columns + column
+# ---------------------------------------------------------------------------- #
+# Lit les géométries des bâtiments d'un fichier json du cadastre
+def read_buildings(filename):
+    if (use_cache):
+        batches = cache.load_features(filename).batches(batch_size)
+    else:
+        batches = streaming.iterate_batches(filename, batch_size)
+    shapes = []
+    for batch in batches:
+        if (hasattr(batch, "shapes")):
+            shapes += batch.shapes()
+        else:
+            shapes += [geom.shape(element["geometry"]) for element in batch]
+    return sp.buffer(np.array(shapes, dtype = object), 0)
+# ---------------------------------------------------------------------------- #
+# Créé la table d'index triée par tuile à partir des bâtiments
+def make_index_table(shapes, communes):
+    bounds = sp.bounds(shapes).reshape(-1, 4)
+    keys = get_tile_keys(
+        (bounds[:, 0] + bounds[:, 2]) / 2., (bounds[:, 1] + bounds[:, 3]) / 2.
+    )
+    order = np.argsort(keys, kind = "stable")
+    bounds = bounds[order]
+    extent = [0., 0., 0., 0.]
+    if (len(bounds) > 0):
+        extent = [
+            bounds[:, 0].min(), bounds[:, 1].min(),
+            bounds[:, 2].max(), bounds[:, 3].max()
+        ]
+    width = np.max(bounds[:, 2] - bounds[:, 0], initial = 0.)
+    height = np.max(bounds[:, 3] - bounds[:, 1], initial = 0.)
+    metadata = {
+        "extent": ",".join([repr(float(x)) for x in extent]),
+        "max_width": repr(float(width)),
+        "max_height": repr(float(height)),
+    }
+    table = pa.table({
+        "key": pa.array(keys[order]),
+        "commune": pa.array(np.asarray(communes, dtype = object)[order]),
+        "minx": pa.array(bounds[:, 0]),
+        "miny": pa.array(bounds[:, 1]),
+        "maxx": pa.array(bounds[:, 2]),
+        "maxy": pa.array(bounds[:, 3]),
+        "wkb": pa.array(list(sp.to_wkb(shapes[order])), type = pa.binary()),
+    })
+    return table.replace_schema_metadata(metadata)
+# ---------------------------------------------------------------------------- #
+# Construit et sauvegarde l'index des bâtiments d'un département
+def build_department_index(department, root = None, directory = None):
+    shapes = []
+    communes = []
+    for code, filename in find_buildings_files(department, root):
+        buildings = read_buildings(filename)
+        shapes.append(buildings)
+        communes += [code] * len(buildings)
+    shapes = np.concatenate(shapes) if (shapes) else np.array([], object)
+    table = make_index_table(shapes, communes)
+    cache.write_table(table, get_index_file(department, directory))
+    return table.num_rows
+# ---------------------------------------------------------------------------- #
+# Tâche d'un processus : construit l'index d'un département
+def build_department_index_task(arguments):
+    department, root, directory = arguments
+    try:
+        return department, build_department_index(department, root, directory)
+    except Exception as error:
+        return department, repr(error)
+# ---------------------------------------------------------------------------- #
+# Construit l'index des bâtiments de tous les départements en parallèle
+def build_index(
+    departments = None,
+    root = None,
+    directory = None,
+    processes = workers
+):
+    if (departments is None):
+        departments = find_departments(root)
+    tasks = [(department, root, directory) for department in departments]
+    failures = {}
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.imap_unordered(build_department_index_task, tasks)
+        for i, (department, result) in enumerate(results):
+            if (type(result) == str):
+                failures[department] = result
+            print(
+                i + 1, "/", len(tasks), "départements |", department, "|",
+                result, "| %.1f s" % (time.perf_counter() - start)
+            )
+    return failures
+# ============================================================================ #
+
+
+
+# ================================= REQUETES ================================= #
+# Retourne une vue numpy sans copie d'une colonne numérique de l'index
+def get_view(column):
+    chunks = column.chunks
+    if (len(chunks) == 1):
+        return chunks[0].to_numpy()
+    return column.to_numpy()
+# ---------------------------------------------------------------------------- #
+# Trouve les paires d'emprises qui s'intersectent entre deux tableaux de boîtes
+# par balayage des secondes triées selon leur abscisse minimale
+def intersect_boxes(first, second):
+    order = np.argsort(second[:, 0], kind = "stable")
+    minx = second[order, 0]
+    # Marge doublée pour absorber les arrondis sur les largeurs
+    width = 2. * np.max(second[:, 2] - second[:, 0], initial = 0.)
+    low = np.searchsorted(minx, first[:, 0] - width, "left")
+    high = np.searchsorted(minx, first[:, 2], "right")
+    counts = np.maximum(high - low, 0)
+    total = int(counts.sum())
+    left = np.repeat(np.arange(len(first), dtype = np.int64), counts)
+    shifts = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = order[np.repeat(low, counts) + shifts]
+    mask = (second[right, 0] <= first[left, 2])
+    mask &= (second[right, 2] >= first[left, 0])
+    mask &= (second[right, 1] <= first[left, 3])
+    mask &= (second[right, 3] >= first[left, 1])
+    pairs = np.stack([left[mask], right[mask].astype(np.int64)])
+    return pairs[:, np.lexsort((pairs[1], pairs[0]))]
+# ---------------------------------------------------------------------------- #
+# Accès paresseux aux géométries de l'index
+class Geometries:
+    # Constructeur
+    def __init__(self, index):
+        self.index = index
+    # Décode les géométries correspondant à des indices globaux
+    def take(self, indices):
+        indices = np.asarray(indices, dtype = np.int64)
+        output = np.empty(len(indices), dtype = object)
+        parts = np.searchsorted(self.index.offsets, indices, side = "right") - 1
+        for part in np.unique(parts):
+            mask = parts == part
+            rows = indices[mask] - self.index.offsets[part]
+            wkb = self.index.load(part)[2].take(pa.array(rows))
+            output[mask] = sp.from_wkb(wkb.to_numpy(zero_copy_only = False))
+        return output
+# ---------------------------------------------------------------------------- #
+# Index spatial des bâtiments sur un ensemble de départements, dont seules les
+# métadonnées sont lues à l'ouverture et les colonnes au premier accès
+class BuildingsIndex:
+    # Constructeur
+    def __init__(self, filenames):
+        self.filenames = list(filenames)
+        self.keys = [None] * len(self.filenames)
+        self.bounds = [None] * len(self.filenames)
+        self.wkb = [None] * len(self.filenames)
+        self.extents = []
+        self.margins = []
+        self.offsets = [0]
+        for filename in self.filenames:
+            reader = pa.ipc.open_file(pa.memory_map(filename, "r"))
+            metadata = reader.schema.metadata or {}
+            self.extents.append([
+                float(x) for x in metadata[b"extent"].decode().split(",")
+            ])
+            self.margins.append((
+                float(metadata[b"max_width"]) / 2.,
+                float(metadata[b"max_height"]) / 2.
+            ))
+            rows = sum([
+                reader.get_batch(i).num_rows
+                for i in range(reader.num_record_batches)
+            ])
+            self.offsets.append(self.offsets[-1] + rows)
+        self.offsets = np.array(self.offsets, dtype = np.int64)
+        self.geometries = Geometries(self)
+    # Charge les colonnes d'un département au premier accès
+    def load(self, part):
+        if (self.keys[part] is None):
+            table = cache.read_table(self.filenames[part])
+            self.bounds[part] = tuple([
+                get_view(table.column(name))
+                for name in ["minx", "miny", "maxx", "maxy"]
+            ])
+            self.wkb[part] = table.column("wkb").combine_chunks()
+            self.keys[part] = table.column("key").to_numpy()
+        return self.keys[part], self.bounds[part], self.wkb[part]
+    # Nombre de bâtiments
+    def __len__(self):
+        return int(self.offsets[-1])
+    # Retourne les indices des bâtiments dont l'emprise intersecte une boîte,
+    # et optionnellement leurs emprises
+    def query_bounds(self, minx, miny, maxx, maxy, return_bounds = False):
+        output = []
+        boxes = []
+        for part, extent in enumerate(self.extents):
+            if (self.offsets[part + 1] == self.offsets[part]):
+                continue
+            if (minx > extent[2] or maxx < extent[0]):
+                continue
+            if (miny > extent[3] or maxy < extent[1]):
+                continue
+            # Tuiles pouvant contenir le centre d'un bâtiment intersectant
+            width, height = self.margins[part]
+            low = get_tile_keys(minx - width, miny - height)
+            high = get_tile_keys(maxx + width, maxy + height)
+            first = low % grid_columns
+            last = high % grid_columns
+            keys, part_bounds, _ = self.load(part)
+            for row in range(low // grid_columns, high // grid_columns + 1):
+                start = np.searchsorted(keys, row * grid_columns + first)
+                end = np.searchsorted(keys, row * grid_columns + last, "right")
+                if (start >= end):
+                    continue
+                # Filtre exact sur les emprises
+                bounds = [x[start:end] for x in part_bounds]
+                mask = (bounds[0] <= maxx) & (bounds[2] >= minx)
+                mask &= (bounds[1] <= maxy) & (bounds[3] >= miny)
+                rows = np.nonzero(mask)[0]
+                output.append(rows + start + self.offsets[part])
+                if (return_bounds):
+                    boxes.append(np.stack([x[rows] for x in bounds], axis = 1))
+        indices = np.concatenate(output) if (output) else np.array([], np.int64)
+        if (return_bounds):
+            boxes = np.concatenate(boxes) if (boxes) else np.zeros((0, 4))
+            return indices, boxes
+        return indices
+    # Retourne les indices des bâtiments dont l'emprise intersecte une géométrie
+    # ou, pour un tableau de géométries, les paires (géométrie, bâtiment)
+    def query(self, geometry, predicate = None):
+        single = isinstance(geometry, sp.Geometry)
+        geometries = np.empty(1, dtype = object) if (single) else None
+        if (single):
+            geometries[0] = geometry
+        else:
+            geometries = np.asarray(geometry, dtype = object)
+        if (len(geometries) == 0):
+            return np.zeros((2, 0), dtype = np.int64)
+        # Candidats de l'ensemble puis paires par filtre vectorisé des emprises
+        extents = sp.bounds(geometries).reshape(-1, 4)
+        candidates, bounds = self.query_bounds(
+            *sp.total_bounds(geometries), return_bounds = True
+        )
+        pairs = intersect_boxes(extents, bounds)
+        # Prédicat exact sur les seuls candidats, décodés une fois chacun
+        if (predicate and pairs.shape[1] > 0):
+            rows, inverse = np.unique(pairs[1], return_inverse = True)
+            shapes = self.geometries.take(candidates[rows])[inverse]
+            mask = getattr(sp, predicate)(geometries[pairs[0]], shapes)
+            pairs = pairs[:, mask]
+        pairs[1] = candidates[pairs[1]]
+        return pairs[1] if (single) else pairs
+# ---------------------------------------------------------------------------- #
+# Ouvre l'index de tous les départements disponibles une fois par processus,
+# les départements n'étant chargés que si une requête touche leur emprise
+@functools.lru_cache(maxsize = 8)
+def open_index(directory = None):
+    directory = directory if (directory) else get_index_directory()
+    filenames = sorted([
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith("batiments-") and name.endswith(".arrow")
+    ])
+    return BuildingsIndex(filenames)
+# ============================================================================ #
@@ -0,0 +1,543 @@
+# ================================ INSTALLER ================================= #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         installer.py
+# Description :     Téléchargement et installation des bases de données
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3      
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import re
+import sys
+import copy
+import gzip
+import time
+import base64
+import shutil
+import hashlib
+import tarfile
+import zlib
+import threading
+import html.parser
+import http.client
+import urllib.parse
+import concurrent.futures
+# Aliases
+import datetime as dt
+import xml.etree.ElementTree as et
+# Modules
+from datetime import datetime
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Dossiers
+root_directory = "analyse-cadastre-dvf"
+tmp_directory = "tmp"
+# Addresses web des données
+link_etalab_cadastre = "https://cadastre.data.gouv.fr/data/etalab-cadastre"
+link_etalab_dvf = "https://cadastre.data.gouv.fr/data/etalab-dvf"
+# Téléchargements simultanés, tentatives et attente initiale entre tentatives
+download_workers = 16
+download_retries = 5
+download_backoff = 1.
+# Délai d'attente des connexions en secondes et taille des blocs lus
+download_timeout = 60
+download_chunk_size = 1024 ** 2
+# Fréquence d'affichage de la progression
+progress_interval = 100
+# ============================================================================ #
+
+
+
+# ================================= DOSSIERS ================================= #
+# Trouves le noms de dossier complet pour les données
+def get_data_directory(root = root_directory):
+    current = os.path.realpath('.')
+    path = current.partition(root)[0] + os.sep + root + os.sep + "data" + os.sep
+    return path
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Calcules le préfixe commun à des chaines de caractères
+def common_prefix(strings):
+    return os.path.commonprefix(strings)
+# ---------------------------------------------------------------------------- #
+# Sauvegarde la liste dans le fichier
+def save_list(links, root = None, filename = None):
+    if (not filename):
+        directory = get_data_directory()
+        directory = directory.rstrip(os.sep) + os.sep + tmp_directory + os.sep
+        if (not os.path.isdir(directory)):
+            os.mkdir(directory)
+        filename = common_prefix(links).rpartition("/")[0].rstrip("/")
+        filename = filename.partition("://")[2].strip("/")
+        if (root):
+            filename = root.strip("/") + "_" + filename.partition(root)[2]
+        filename = directory + filename.replace("/", "_") + ".txt"
+        filename = filename.replace("//", "/").replace("__", "_")
+    stream = open(filename, "w+")
+    for element in links:
+        stream.write(element + "\n")
+    stream.close()
+    return filename
+# ---------------------------------------------------------------------------- #
+# Retourne le chemin local d'un fichier à télécharger
+def get_download_path(link, root = None):
+    directory = get_data_directory().rstrip(os.sep)
+    path = link.strip().partition("://")[2].strip("/")
+    if (root and path.find(root) >= 0):
+        root = root.strip("/")
+        path = root + os.sep + path.rpartition(root)[2].rstrip("/")
+    return (directory + os.sep + path).replace("//", "/")
+# ---------------------------------------------------------------------------- #
+# Décompresse un fichier gzip par blocs et l'écrit atomiquement
+def decompress_file(source, target, chunk = download_chunk_size):
+    directory, name = os.path.split(target)
+    temporary = os.path.join(directory, "." + name + "." + str(os.getpid()))
+    with gzip.open(source, "rb") as input_stream:
+        with open(temporary, "wb") as output_stream:
+            shutil.copyfileobj(input_stream, output_stream, chunk)
+    os.replace(temporary, target)
+# ---------------------------------------------------------------------------- #
+# Process une liste de fichiers, en décompressant les fichiers gzip pendant
+# leur téléchargement si demandé
+def download_list(
+    links,
+    root = None,
+    processes = download_workers,
+    decompress = True
+):
+    # Téléchargement des fichiers absents
+    tasks = []
+    for link in links:
+        name = link.strip()
+        full_path = get_download_path(name, root)
+        full_file = full_path.replace(".gz", "")
+        if (os.path.exists(full_path) or os.path.exists(full_file)):
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok = True)
+        if (decompress and full_path.endswith(".gz")):
+            tasks.append((name, full_file, None, None, True))
+        else:
+            tasks.append((name, full_path))
+    failures = download_files(tasks, processes)
+    # Décompression des fichiers gzip restants
+    for link in links:
+        full_path = get_download_path(link.strip(), root)
+        full_file = full_path.replace(".gz", "")
+        if (os.path.exists(full_path) and not os.path.exists(full_file)):
+            decompress_file(full_path, full_file)
+            os.remove(full_path)
+    return failures
+# ---------------------------------------------------------------------------- #
+# Retourne le nom complet d'une liste sauvegardée, cherchée dans le dossier
+# temporaire si elle n'existe pas telle quelle
+def get_list_file(filename):
+    if (os.path.exists(filename)):
+        return filename
+    directory = get_data_directory().rstrip(os.sep) + os.sep + tmp_directory
+    return (directory + os.sep + filename).replace("//", "/")
+# ---------------------------------------------------------------------------- #
+# Télécharge les fichiers d'une liste sauvegardée par save_list
+def download_saved_list(
+    filename,
+    root = None,
+    processes = download_workers,
+    decompress = True
+):
+    with open(get_list_file(filename)) as stream:
+        links = [line for line in stream.read().splitlines() if line.strip()]
+    return download_list(links, root, processes, decompress)
+# ============================================================================ #
+
+
+
+
+# ============================== TELECHARGEMENT ============================== #
+# Erreur de téléchargement, définitive si une nouvelle tentative est inutile
+class DownloadError(IOError):
+    # Constructeur
+    def __init__(self, message, permanent = False):
+        super().__init__(message)
+        self.permanent = permanent
+# ---------------------------------------------------------------------------- #
+# Connexions persistantes de chaque fil d'exécution
+connections = threading.local()
+# ---------------------------------------------------------------------------- #
+# Retourne la connexion persistante du fil courant vers le serveur d'une adresse
+def get_connection(url, timeout = download_timeout):
+    parts = urllib.parse.urlsplit(url)
+    pool = connections.__dict__.setdefault("pool", {})
+    key = (parts.scheme, parts.netloc)
+    if (key not in pool):
+        if (parts.scheme == "https"):
+            connection = http.client.HTTPSConnection
+        else:
+            connection = http.client.HTTPConnection
+        pool[key] = connection(parts.netloc, timeout = timeout)
+    return pool[key]
+# ---------------------------------------------------------------------------- #
+# Ferme la connexion persistante du fil courant vers le serveur d'une adresse
+def close_connection(url):
+    parts = urllib.parse.urlsplit(url)
+    pool = connections.__dict__.get("pool", {})
+    connection = pool.pop((parts.scheme, parts.netloc), None)
+    if (connection):
+        connection.close()
+# ---------------------------------------------------------------------------- #
+# Envoie une requête et retourne l'adresse finale et la réponse
+def open_url(url, headers = {}, redirections = 5):
+    for i in range(redirections + 1):
+        parts = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(
+            ("", "", parts.path or "/", parts.query, "")
+        )
+        connection = get_connection(url)
+        try:
+            connection.request("GET", path, headers = headers)
+            response = connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            close_connection(url)
+            raise
+        if (response.status not in [301, 302, 303, 307, 308]):
+            return url, response
+        response.read()
+        url = urllib.parse.urljoin(url, response.getheader("Location"))
+    raise DownloadError("Too many redirections: " + url, True)
+# ---------------------------------------------------------------------------- #
+# Calcule l'empreinte sha256 d'un fichier
+def hash_file(filename, size = download_chunk_size):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as stream:
+        for chunk in iter(lambda: stream.read(size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+# ---------------------------------------------------------------------------- #
+# Décompresse à la volée un flux gzip éventuellement composé de plusieurs
+# membres, en calculant l'empreinte des données compressées
+class Inflater:
+    # Constructeur
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self.digest = hashlib.sha256()
+    # Décompresse un bloc de données par morceaux de taille bornée
+    def decompress(self, data, size = download_chunk_size):
+        self.digest.update(data)
+        while (data):
+            try:
+                yield self.decompressor.decompress(data, size)
+            except zlib.error as error:
+                raise DownloadError("Invalid gzip stream: " + str(error))
+            data = self.decompressor.unconsumed_tail
+            if (not data and self.decompressor.eof):
+                data = self.decompressor.unused_data
+                if (data):
+                    self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    # Indique si le dernier membre est complet
+    def complete(self):
+        return self.decompressor.eof
+# ---------------------------------------------------------------------------- #
+# Télécharge un fichier en reprenant un téléchargement partiel, vérifie sa
+# taille et son empreinte puis le renomme atomiquement ; un fichier gzip peut
+# être décompressé à la volée, sans reprise possible
+def download_file(
+    url,
+    filename,
+    size = None,
+    checksum = None,
+    decompress = False,
+    chunk = download_chunk_size
+):
+    partial = filename + ".part"
+    offset = os.path.getsize(partial) if (os.path.exists(partial)) else 0
+    offset = 0 if (decompress) else offset
+    headers = {"Range": "bytes=" + str(offset) + "-"} if (offset) else {}
+    url, response = open_url(url, headers)
+    inflater = Inflater() if (decompress) else None
+    received = 0
+    # Fichier partiel déjà complet
+    if (response.status == 416):
+        response.read()
+        total = response.getheader("Content-Range", "").rpartition("/")[2]
+        if (not (total.isdigit() and int(total) == offset)):
+            os.remove(partial)
+            raise DownloadError("Invalid partial file: " + filename)
+        expected = offset
+    # Reprise ou téléchargement complet
+    elif (response.status in [200, 206]):
+        offset = offset if (response.status == 206) else 0
+        length = response.getheader("Content-Length")
+        expected = offset + int(length) if (length) else None
+        try:
+            with open(partial, "ab" if (offset) else "wb") as stream:
+                for data in iter(lambda: response.read(chunk), b""):
+                    received += len(data)
+                    blocks = inflater.decompress(data) if (inflater) else [data]
+                    for block in blocks:
+                        stream.write(block)
+        except (http.client.HTTPException, OSError):
+            close_connection(url)
+            raise
+    # Erreur du serveur
+    else:
+        response.read()
+        permanent = response.status < 500 and response.status not in [408, 429]
+        raise DownloadError(
+            "HTTP " + str(response.status) + ": " + url, permanent
+        )
+    # Vérifications
+    total = offset + received
+    if (expected is not None and total != expected):
+        close_connection(url)
+        raise DownloadError("Incomplete download: " + url)
+    if (inflater and not inflater.complete()):
+        raise DownloadError("Incomplete gzip stream: " + url)
+    digest = None
+    if (checksum and inflater):
+        digest = inflater.digest.hexdigest()
+    elif (checksum):
+        digest = hash_file(partial)
+    if ((size is not None and total != size)
+        or (checksum and digest != checksum)):
+        os.remove(partial)
+        raise DownloadError("Invalid download: " + url)
+    os.replace(partial, filename)
+    return received
+# ---------------------------------------------------------------------------- #
+# Télécharge un fichier en réessayant avec une attente croissante
+def download_file_retrying(
+    url,
+    filename,
+    size = None,
+    checksum = None,
+    decompress = False,
+    retries = download_retries,
+    backoff = download_backoff
+):
+    for attempt in range(retries + 1):
+        try:
+            return download_file(url, filename, size, checksum, decompress)
+        except (http.client.HTTPException, OSError) as error:
+            close_connection(url)
+            if (getattr(error, "permanent", False) or attempt == retries):
+                raise
+        time.sleep(backoff * 2 ** attempt)
+# ---------------------------------------------------------------------------- #
+# Télécharge une liste de couples (adresse, fichier) en parallèle et retourne
+# les échecs
+def download_files(
+    tasks,
+    processes = download_workers,
+    interval = progress_interval
+):
+    failures = {}
+    nfiles = 0
+    nbytes = 0
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(processes) as executor:
+        futures = {
+            executor.submit(download_file_retrying, *task): task[0]
+            for task in tasks
+        }
+        for future in concurrent.futures.as_completed(futures):
+            nfiles += 1
+            try:
+                nbytes += future.result()
+            except Exception as error:
+                failures[futures[future]] = repr(error)
+            if (nfiles % interval == 0 or nfiles == len(tasks)):
+                elapsed = max(time.perf_counter() - start, 1e-9)
+                print(
+                    nfiles, "/", len(tasks), "fichiers |",
+                    "%.2f fichiers/s |" % (nfiles / elapsed),
+                    "%.2f Mo/s |" % (nbytes / elapsed / 1024 ** 2),
+                    len(failures), "échecs"
+                )
+    for url, error in failures.items():
+        print("ERROR", url, error)
+    return failures
+# ============================================================================ #
+
+
+# ============================= CADASTRE ETALAB ============================== #
+# Extrait les liens d'une page html
+class LinksParser(html.parser.HTMLParser):
+    # Constructeur
+    def __init__(self):
+        super().__init__()
+        self.links = []
+    # Conserve la destination de chaque lien
+    def handle_starttag(self, tag, attributes):
+        href = dict(attributes).get("href") if (tag == "a") else None
+        if (href is not None):
+            self.links.append(href)
+# ---------------------------------------------------------------------------- #
+# Lit une page et retourne son adresse finale et ses liens absolus
+def read_links(url, retries = download_retries, backoff = download_backoff):
+    for attempt in range(retries + 1):
+        try:
+            url, response = open_url(url)
+            content = response.read()
+            if (response.status != 200):
+                raise DownloadError(
+                    "HTTP " + str(response.status) + ": " + url,
+                    response.status < 500 and response.status not in [408, 429]
+                )
+            break
+        except (http.client.HTTPException, OSError) as error:
+            close_connection(url)
+            if (getattr(error, "permanent", False) or attempt == retries):
+                raise
+        time.sleep(backoff * 2 ** attempt)
+    charset = response.headers.get_content_charset() or "utf-8"
+    parser = LinksParser()
+    parser.feed(content.decode(charset, "replace"))
+    return url, [urllib.parse.urljoin(url, href) for href in parser.links]
+# ---------------------------------------------------------------------------- #
+# Explorateur de pages gardant en mémoire les pages déjà lues
+class Crawler:
+    # Constructeur
+    def __init__(self, processes = download_workers):
+        self.executor = concurrent.futures.ThreadPoolExecutor(processes)
+        self.pages = {}
+    # Retourne l'adresse finale et les liens d'une page
+    def get(self, url):
+        if (url not in self.pages):
+            self.pages[url] = read_links(url)
+        return self.pages[url]
+    # Lit un ensemble de pages en parallèle
+    def prefetch(self, urls):
+        urls = [url for url in urls if url not in self.pages]
+        for url, page in zip(urls, self.executor.map(read_links, urls)):
+            self.pages[url] = page
+    # Termine les fils d'exécution
+    def close(self):
+        self.executor.shutdown()
+# ---------------------------------------------------------------------------- #
+# Vérifie si un lien pointe vers un élément contenu dans une page
+def is_descendant(href, url):
+    href = urllib.parse.urldefrag(href)[0]
+    return (
+        href.startswith(url.rstrip("/") + "/")
+        and len(href.strip("/")) > len(url.strip("/"))
+        and not urllib.parse.urlsplit(href).query
+    )
+# ---------------------------------------------------------------------------- #
+# Récupère récursivement le nom de tous les fichiers
+def explore_etalab_cadastre_recursively(
+    crawler,
+    url,
+    root,
+    links,
+):
+    # Initialisation
+    filenames = []
+    affixes = []
+    subdirectories = []
+    url, hrefs = crawler.get(url)
+    parent = urllib.parse.urljoin(url, "../")
+    directory = url.strip("/").rpartition("/")[2].strip()
+    bulk = False
+    # Boucle sur les liens contenus dans la page
+    for href in hrefs:
+        # Si le lien descend dans l'arborescence
+        if (is_descendant(href, url)):
+            # Isole le nom de l'élément
+            name = href.strip("/").rpartition("/")[2]
+            # Si il s'agit d'un fichier
+            if (name.count(".") > 0):
+                filenames.append(href)
+            # Si il s'agit d'un dossier
+            else:
+                subdirectories.append(href)
+    # Si il ne s'agit que de fichiers et d'aucun dossiers
+    if (len(filenames) > 0 and len(subdirectories) == 0):
+        # Calcules les préfixes et les suffixes de chaque nom de fichier
+        for filename in filenames:
+            name = filename.rpartition("/")[2]
+            if (name.find(directory) >= 0):
+                prefix = name.partition(directory)[0]
+                suffix = name.partition(directory)[2]
+                affixes.append((prefix, suffix))
+        # Si tous les fichiers sont dans le même format
+        if (len(affixes) != len(filenames)):
+            affixes = []
+    # Si la liste d'affixes n'est pas vide
+    if (len(affixes) > 0):
+        # Remonter d'un répertoire
+        if (len(parent.strip("/")) >= len(root.strip("/"))):
+            url, hrefs = crawler.get(parent)
+            subdirectories = [
+                href for href in hrefs if is_descendant(href, url)
+            ]
+            filenames = []
+            # Calcules tous les noms de fichiers en fonction des répertoires
+            for subdirectory in subdirectories:
+                name = subdirectory.strip("/").rpartition("/")[2]
+                for affix in affixes:
+                    filename = subdirectory.strip("/") + "/"
+                    filename += affix[0] + name + affix[1]
+                    filenames.append(filename)
+            # Merge les noms de fichiers avec la liste des liens
+            links += filenames
+            bulk = True
+    # Si la liste d'affixes est vide, continuer à processer normalement
+    else:
+        # Descente dans les sous-répertoires : si le premier ne suffit pas à
+        # déduire tous les fichiers, les suivants sont lus en parallèle
+        links += filenames
+        for i, subdirectory in enumerate(subdirectories):
+            if (i == 1):
+                crawler.prefetch(subdirectories[1:])
+            if(explore_etalab_cadastre_recursively(
+                crawler, subdirectory, root, links
+            )):
+                break
+    # Retourne si les données on été traitées en bulk
+    return bulk
+# ---------------------------------------------------------------------------- #
+# Récupère les noms de tous les fichiers du cadastre
+def explore_etalab_cadastre(
+    link = link_etalab_cadastre,
+    version = "2017-07-06",
+    extension = "geojson",
+    level = "communes",
+    processes = download_workers
+):
+    # Initialisation
+    files = []
+    url = link.rstrip("/") + "/" + version + "/" + extension + "/"
+    url += level + "/"
+    # Exploration récursive de tous les fichiers
+    crawler = Crawler(processes)
+    try:
+        url = crawler.get(url)[0]
+        explore_etalab_cadastre_recursively(crawler, url, url, files)
+    finally:
+        crawler.close()
+    # Retourne la liste de tous les fichiers
+    return files
+# ============================================================================ #
+
+
+
+# ================================= PROGRAMME ================================ #
+# Programme principal
+def main():
+    # Obtiens la liste des fichiers du cadastre
+    files = explore_etalab_cadastre()
+    # Sauvegarde la liste des fichiers
+    save_list(files, link_etalab_cadastre.strip("/").rpartition("/")[2])
+# ---------------------------------------------------------------------------- #
+if __name__ == "__main__":
+    main()
+# ============================================================================ #
@@ -0,0 +1,270 @@
+# ================================== PARCELS ================================= #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         parcels.py
+# Description :     Index des parcelles du cadastre et jointure avec les dvf
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import time
+import functools
+import multiprocessing
+# Aliases
+import numpy as np
+import pyarrow as pa
+import shapely as sp
+import shapely.geometry as geom
+import pyarrow.feather as pafeather
+# Projet
+from . import cache
+from . import analyzer
+from . import indexer
+from . import metrics
+from . import enhancer
+from . import streaming
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Cache binaire des fichiers json
+use_cache = True
+# Nombre d'éléments lus à la fois
+batch_size = 10000
+# Parallélisation
+workers = os.cpu_count()
+# Schéma de l'index des parcelles
+parcels_schema = pa.schema([
+    ("id", pa.string()),
+    ("commune", pa.string()),
+    ("offset", pa.int32()),
+    ("land_area", pa.float64()),
+    ("land_perimeter", pa.float64()),
+    ("longitude", pa.float64()),
+    ("latitude", pa.float64()),
+])
+# Colonnes des parcelles augmentées ajoutées aux dvf
+building_columns = [
+    "land_rectangle_min",
+    "land_rectangle_max",
+    "land_ratio",
+    "buildings",
+    "merged_area",
+    "building_area",
+    "largest_building_area",
+]
+# ============================================================================ #
+
+
+
+# ================================= DOSSIERS ================================= #
+# Retourne le nom du fichier d'index des parcelles d'un département
+def get_parcels_file(department, directory = None):
+    directory = directory if (directory) else indexer.get_index_directory()
+    filename = directory.rstrip("/") + "/parcelles-" + str(department)
+    filename += ".arrow"
+    return filename
+# ---------------------------------------------------------------------------- #
+# Trouve les fichiers de parcelles des communes d'un département
+def find_parcels_files(department, root = None):
+    directory = (root if (root) else indexer.get_cadastre_directory())
+    directory = directory.rstrip("/") + "/" + str(department)
+    files = []
+    for code in sorted(os.listdir(directory)):
+        filename = directory + "/" + code + "/cadastre-" + code
+        filename += "-parcelles.json"
+        if (os.path.isfile(filename)):
+            files.append((code, filename))
+    return files
+# ============================================================================ #
+
+
+
+# =============================== CONSTRUCTION =============================== #
+# Lit les parcelles d'un fichier json et calcule leurs propriétés en colonnes
+def read_parcels(filename):
+    if (use_cache):
+        batches = cache.load_features(filename).batches(batch_size)
+    else:
+        batches = streaming.iterate_batches(filename, batch_size)
+    columns = {name: [] for name in parcels_schema.names if name != "commune"}
+    for batch in batches:
+        if (hasattr(batch, "shapes")):
+            ids = batch.ids()
+            shapes = np.array(batch.shapes(), dtype = object)
+        else:
+            ids = [element["id"] for element in batch]
+            shapes = np.array(
+                [geom.shape(element["geometry"]) for element in batch],
+                dtype = object
+            )
+        land_metrics = metrics.compute_features_metrics(batch)
+        centroids = sp.centroid(shapes)
+        columns["id"] += ids
+        columns["land_area"].append(land_metrics["area"])
+        columns["land_perimeter"].append(land_metrics["perimeter"])
+        columns["longitude"].append(sp.get_x(centroids))
+        columns["latitude"].append(sp.get_y(centroids))
+    for name in ["land_area", "land_perimeter", "longitude", "latitude"]:
+        columns[name] = np.concatenate(columns[name] or [np.zeros(0)])
+    columns["offset"] = np.arange(len(columns["id"]), dtype = np.int32)
+    return columns
+# ---------------------------------------------------------------------------- #
+# Construit et sauvegarde l'index des parcelles d'un département, trié par
+# identifiant
+def build_department_parcels(department, root = None, directory = None):
+    tables = []
+    for code, filename in find_parcels_files(department, root):
+        columns = read_parcels(filename)
+        columns["commune"] = [code] * len(columns["id"])
+        tables.append(pa.Table.from_pydict(columns, schema = parcels_schema))
+    if (tables):
+        table = pa.concat_tables(tables).sort_by("id").combine_chunks()
+    else:
+        table = parcels_schema.empty_table()
+    cache.write_table(table, get_parcels_file(department, directory))
+    return table.num_rows
+# ---------------------------------------------------------------------------- #
+# Tâche d'un processus : construit l'index des parcelles d'un département
+def build_department_parcels_task(arguments):
+    department, root, directory = arguments
+    try:
+        return department, build_department_parcels(department, root, directory)
+    except Exception as error:
+        return department, repr(error)
+# ---------------------------------------------------------------------------- #
+# Construit l'index des parcelles de tous les départements en parallèle
+def build_parcels_index(
+    departments = None,
+    root = None,
+    directory = None,
+    processes = workers
+):
+    if (departments is None):
+        departments = indexer.find_departments(root)
+    tasks = [(department, root, directory) for department in departments]
+    failures = {}
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.imap_unordered(build_department_parcels_task, tasks)
+        for i, (department, result) in enumerate(results):
+            if (type(result) == str):
+                failures[department] = result
+            print(
+                i + 1, "/", len(tasks), "départements |", department, "|",
+                result, "| %.1f s" % (time.perf_counter() - start)
+            )
+    return failures
+# ============================================================================ #
+
+
+
+# ================================= JOINTURE ================================= #
+# Charge l'index des parcelles d'un ensemble de départements
+def load_parcels(departments, directory = None):
+    tables = []
+    for department in sorted(set([str(x) for x in departments])):
+        filename = get_parcels_file(department, directory)
+        if (os.path.exists(filename)):
+            tables.append(cache.read_table(filename))
+    if (not tables):
+        return parcels_schema.empty_table().to_pandas()
+    return pa.concat_tables(tables).to_pandas()
+# ---------------------------------------------------------------------------- #
+# Ouvre l'index des parcelles d'un département une fois par processus
+@functools.lru_cache(maxsize = 8)
+def open_parcels(department, directory = None):
+    filename = get_parcels_file(department, directory)
+    if (not os.path.exists(filename)):
+        return None
+    table = cache.read_table(filename)
+    return table.column("id").to_numpy(zero_copy_only = False), table
+# ---------------------------------------------------------------------------- #
+# Retrouve des parcelles par recherche dichotomique dans l'index trié, dans
+# l'ordre des identifiants du cadastre demandés
+def find_parcels(ids, directory = None):
+    ids = np.array([str(x) for x in ids], dtype = object)
+    departments = np.array(
+        [enhancer.get_city_department(x[:5]) for x in ids], dtype = object
+    )
+    tables = []
+    order = []
+    for department in sorted(set(departments)):
+        index = open_parcels(department, directory)
+        if (index is None or len(index[0]) == 0):
+            continue
+        keys, table = index
+        selection = np.nonzero(departments == department)[0]
+        positions = np.searchsorted(keys, ids[selection])
+        positions = np.minimum(positions, len(keys) - 1)
+        found = keys[positions] == ids[selection]
+        tables.append(table.take(pa.array(positions[found])))
+        order.append(selection[found])
+    if (not tables):
+        df = parcels_schema.empty_table().to_pandas()
+    else:
+        df = pa.concat_tables(tables).to_pandas()
+        df.index = np.concatenate(order)
+    return df.reindex(range(len(ids)))
+# ---------------------------------------------------------------------------- #
+# Associe à chaque mutation dvf sa parcelle du cadastre et ses propriétés
+def join_dvf_parcels(df, directory = None):
+    parcels = load_parcels(df["Code departement"].unique(), directory)
+    parcels = parcels.rename(columns = {"id": "cadastre_id"})
+    parcels = parcels.drop(columns = [
+        c for c in parcels.columns if c in df.columns
+    ])
+    df = df.assign(cadastre_id = analyzer.get_cadastre_ids(df))
+    return df.merge(parcels, on = "cadastre_id", how = "left")
+# ---------------------------------------------------------------------------- #
+# Charge ou calcule les parcelles augmentées d'une commune
+def load_enhanced_city(insee, root = None, output = None, compute = False):
+    filename = enhancer.get_enhanced_file(insee, output)
+    if (os.path.exists(filename)):
+        return pafeather.read_table(filename, memory_map = True)
+    if (compute):
+        table = enhancer.enhance_city(insee, root)
+        enhancer.save_enhanced_city(table, filename)
+        return table
+    return None
+# ---------------------------------------------------------------------------- #
+# Ajoute les propriétés des bâtiments aux mutations dvf associées au cadastre,
+# en ne lisant les résultats de chaque commune qu'une seule fois
+def join_dvf_buildings(df, root = None, output = None, compute = False):
+    if ("commune" not in df.columns):
+        df = join_dvf_parcels(df)
+    tables = []
+    for insee in df["commune"].dropna().unique():
+        table = load_enhanced_city(insee, root, output, compute)
+        if (table is not None):
+            tables.append(table.select(["id"] + building_columns))
+    if (tables):
+        buildings = pa.concat_tables(tables).to_pandas()
+    else:
+        buildings = enhancer.enhanced_schema.empty_table().select(
+            ["id"] + building_columns
+        ).to_pandas()
+    buildings = buildings.rename(columns = {"id": "cadastre_id"})
+    buildings = buildings.drop(columns = [
+        c for c in building_columns if c in df.columns
+    ])
+    return df.merge(buildings, on = "cadastre_id", how = "left")
+# ---------------------------------------------------------------------------- #
+# Associe les mutations dvf aux parcelles et aux bâtiments du cadastre
+def join_dvf_cadastre(
+    df,
+    directory = None,
+    root = None,
+    output = None,
+    compute = False
+):
+    df = join_dvf_parcels(df, directory)
+    return join_dvf_buildings(df, root, output, compute)
+# ============================================================================ #
+
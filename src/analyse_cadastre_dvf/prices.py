@@ -0,0 +1,204 @@
+# ================================== PRICES ================================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         prices.py
+# Description :     Statistiques de prix au m² et recherche de ventes voisines
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Aliases
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely as sp
+# Projet
+from . import cache
+from . import parcels
+from . import analyzer
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Dossiers
+statistics_directory = "statistiques"
+# Colonnes formant la clé de chaque niveau d'agrégation
+statistics_levels = {
+    "commune": ["Code departement", "Code commune"],
+    "section": [
+        "Code departement", "Code commune", "Prefixe de section", "Section"
+    ],
+    "month": ["Code departement", "Code commune", "Annee", "Mois"],
+}
+# Prix au m² calculés : colonne, numérateur et dénominateur
+price_columns = [
+    ("built_price", "Valeur fonciere", "Surface reelle bati"),
+    ("land_price", "Valeur fonciere", "Surface terrain"),
+]
+# Quantiles calculés
+quantiles = [0.1, 0.25, 0.5, 0.75, 0.9]
+# Rayon moyen de la Terre en mètres
+earth_radius = 6371008.8
+# ============================================================================ #
+
+
+
+# ================================= DOSSIERS ================================= #
+# Retourne le dossier des statistiques de prix
+def get_statistics_directory():
+    directory = analyzer.get_dvf_directory() + statistics_directory + "/"
+    directory = directory.replace("//", "/")
+    return directory
+# ---------------------------------------------------------------------------- #
+# Retourne le nom du fichier des statistiques d'un niveau d'agrégation
+def get_statistics_file(level, directory = None):
+    directory = directory if (directory) else get_statistics_directory()
+    return directory.rstrip("/") + "/prix-" + level + ".arrow"
+# ============================================================================ #
+
+
+
+# ================================ STATISTIQUES ============================== #
+# Ajoute les prix au m² aux ventes
+def add_prices(df):
+    columns = {}
+    for name, numerator, denominator in price_columns:
+        values = df[numerator] / df[denominator].where(df[denominator] > 0)
+        columns[name] = values.astype(np.float32)
+    return df.assign(**columns)
+# ---------------------------------------------------------------------------- #
+# Retourne la clé d'agrégation de chaque vente pour un niveau
+def get_group_keys(df, level):
+    columns = statistics_levels[level]
+    keys = df[columns[0]].astype(str)
+    for column in columns[1:]:
+        values = df[column].astype(str)
+        if (column in ["Annee", "Mois"]):
+            values = values.str.pad(2, fillchar = "0")
+        keys = keys + "|" + values
+    return keys
+# ---------------------------------------------------------------------------- #
+# Calcule les statistiques de prix au m² d'un niveau en une table triée
+def compute_group_statistics(df, level):
+    df = add_prices(df) if (price_columns[0][0] not in df.columns) else df
+    names = [name for name, numerator, denominator in price_columns]
+    groups = df[names].groupby(get_group_keys(df, level), sort = True)
+    columns = {"key": pa.array(groups.size().index.astype(str).tolist())}
+    counts = groups.count()
+    means = groups.mean()
+    values = groups.quantile(quantiles)
+    for name in names:
+        columns[name + "_count"] = pa.array(
+            counts[name].to_numpy(), type = pa.int32()
+        )
+        columns[name + "_mean"] = pa.array(
+            means[name].to_numpy(), type = pa.float32()
+        )
+        for q in quantiles:
+            column = name + "_q" + str(int(round(q * 100)))
+            columns[column] = pa.array(
+                values[name].xs(q, level = -1).to_numpy(), type = pa.float32()
+            )
+    return pa.table(columns)
+# ---------------------------------------------------------------------------- #
+# Calcule et sauvegarde les statistiques de prix de tous les niveaux
+def build_statistics(df = None, levels = None, directory = None):
+    df = analyzer.load_preprocessed_file() if (df is None) else df
+    levels = levels if (levels) else list(statistics_levels)
+    tables = {}
+    for level in levels:
+        tables[level] = compute_group_statistics(df, level)
+        cache.write_table(tables[level], get_statistics_file(level, directory))
+    return tables
+# ---------------------------------------------------------------------------- #
+# Statistiques de prix précalculées, consultées par recherche dichotomique
+class PriceStatistics:
+    # Constructeur
+    def __init__(self, directory = None, levels = None):
+        levels = levels if (levels) else list(statistics_levels)
+        self.tables = {}
+        self.keys = {}
+        for level in levels:
+            table = cache.read_table(get_statistics_file(level, directory))
+            self.tables[level] = table
+            self.keys[level] = table.column("key").to_numpy(
+                zero_copy_only = False
+            )
+    # Statistiques d'un ensemble de clés, manquantes si la clé est inconnue
+    def get(self, level, keys):
+        keys = np.array([str(key) for key in keys], dtype = object)
+        sorted_keys = self.keys[level]
+        if (len(sorted_keys) == 0):
+            found = np.zeros(len(keys), dtype = bool)
+            positions = np.zeros(len(keys), dtype = np.int64)
+        else:
+            positions = np.searchsorted(sorted_keys, keys)
+            positions = np.minimum(positions, len(sorted_keys) - 1)
+            found = sorted_keys[positions] == keys
+        df = self.tables[level].take(pa.array(positions[found])).to_pandas()
+        df.index = np.nonzero(found)[0]
+        return df.reindex(range(len(keys)))
+    # Statistiques des ventes d'un tableau dvf
+    def lookup(self, df, level):
+        return self.get(level, get_group_keys(df, level))
+# ============================================================================ #
+
+
+
+# ================================= VOISINAGE ================================ #
+# Calcule les distances en mètres entre un point et des points
+def compute_distances(longitude, latitude, longitudes, latitudes):
+    phi1 = np.radians(latitude)
+    phi2 = np.radians(latitudes)
+    dphi = phi2 - phi1
+    dlambda = np.radians(longitudes - longitude)
+    a = np.sin(dphi / 2) ** 2
+    a += np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * earth_radius * np.arcsin(np.sqrt(np.minimum(a, 1.)))
+# ---------------------------------------------------------------------------- #
+# Index spatial des ventes sur les centres de leurs parcelles
+class ComparableSales:
+    # Constructeur
+    def __init__(self, df, directory = None):
+        if ("longitude" not in df.columns):
+            df = parcels.join_dvf_parcels(df, directory)
+        df = df[df["longitude"].notna() & df["latitude"].notna()]
+        self.sales = add_prices(df).reset_index(drop = True)
+        self.directory = directory
+        self.longitudes = self.sales["longitude"].to_numpy()
+        self.latitudes = self.sales["latitude"].to_numpy()
+        self.tree = sp.STRtree(sp.points(self.longitudes, self.latitudes))
+    # Nombre de ventes
+    def __len__(self):
+        return len(self.sales)
+    # Retourne les ventes à moins d'un rayon en mètres d'un point, triées par
+    # distance
+    def query(self, longitude, latitude, radius):
+        # Pré-sélection par boîte englobante en degrés
+        dlatitude = np.degrees(radius / earth_radius)
+        cosine = max(np.cos(np.radians(latitude)), 1e-6)
+        dlongitude = min(dlatitude / cosine, 180.)
+        candidates = self.tree.query(sp.box(
+            longitude - dlongitude, latitude - dlatitude,
+            longitude + dlongitude, latitude + dlatitude
+        ))
+        # Filtre exact sur la distance
+        distances = compute_distances(
+            longitude, latitude,
+            self.longitudes[candidates], self.latitudes[candidates]
+        )
+        mask = distances <= radius
+        order = np.argsort(distances[mask], kind = "stable")
+        rows = candidates[mask][order]
+        return self.sales.iloc[rows].assign(distance = distances[mask][order])
+    # Retourne les ventes à moins d'un rayon en mètres d'une parcelle
+    def query_parcel(self, parcel, radius):
+        location = parcels.find_parcels([parcel], self.directory).iloc[0]
+        if (pd.isna(location["longitude"])):
+            raise KeyError(parcel)
+        return self.query(location["longitude"], location["latitude"], radius)
+# ============================================================================ #
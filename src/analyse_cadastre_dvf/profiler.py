@@ -0,0 +1,250 @@
+# ================================= PROFILER ================================= #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         profiler.py
+# Description :     Mesure des temps, des volumes et de la mémoire par étape
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import csv
+import json
+import time
+import cProfile
+import resource
+import contextlib
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Variables d'environnement transmises aux processus de calcul
+enabled_variable = "CADASTRE_DVF_PROFILE"
+profile_variable = "CADASTRE_DVF_PROFILE_DIRECTORY"
+# Activation des mesures et dossier des profils cProfile
+enabled = os.environ.get(enabled_variable) == "1"
+profile_directory = os.environ.get(profile_variable) or None
+# Mesures par étape : appels, temps réel, temps processeur, éléments traités
+stages = {}
+# Mesures par unité de travail (commune, fichier dvf)
+units = []
+# Processus auquel appartiennent les mesures, et processus ayant activé les
+# mesures, qui reçoit celles des processus de calcul
+owner = os.getpid()
+main_process = None
+# Colonnes des rapports
+stage_columns = ["stage", "calls", "wall", "cpu", "items"]
+unit_columns = ["kind", "name", "wall", "cpu", "items", "peak_rss"]
+# ============================================================================ #
+
+
+
+# ================================ ACTIVATION ================================ #
+# Active les mesures, y compris dans les processus créés ensuite
+def enable(directory = None):
+    global enabled, profile_directory, main_process
+    enabled = True
+    profile_directory = directory
+    main_process = os.getpid()
+    reset()
+    os.environ[enabled_variable] = "1"
+    if (directory):
+        os.makedirs(directory, exist_ok = True)
+        os.environ[profile_variable] = directory
+# ---------------------------------------------------------------------------- #
+# Désactive les mesures
+def disable():
+    global enabled, profile_directory
+    enabled = False
+    profile_directory = None
+    os.environ.pop(enabled_variable, None)
+    os.environ.pop(profile_variable, None)
+# ---------------------------------------------------------------------------- #
+# Efface les mesures et les attribue au processus courant
+def reset():
+    global owner
+    owner = os.getpid()
+    stages.clear()
+    del units[:]
+# ---------------------------------------------------------------------------- #
+# Efface les mesures héritées du processus parent par un fork
+def check_process():
+    if (owner != os.getpid()):
+        reset()
+# ---------------------------------------------------------------------------- #
+# Initialisation des processus de calcul d'un pool
+def initialize_worker():
+    reset()
+# ============================================================================ #
+
+
+
+# ================================= MEMOIRE ================================== #
+# Remet à zéro le pic de mémoire résidente du processus si le système le permet
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as stream:
+            stream.write("5")
+    except OSError:
+        pass
+# ---------------------------------------------------------------------------- #
+# Lit une mesure de mémoire du processus en octets, ou None si le système ne
+# la fournit pas
+def read_memory_status(field):
+    try:
+        with open("/proc/self/status") as stream:
+            for line in stream:
+                if (line.startswith(field + ":")):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+# ---------------------------------------------------------------------------- #
+# Retourne le pic de mémoire résidente du processus en octets
+def get_peak_rss():
+    peak = read_memory_status("VmHWM")
+    if (peak is None):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+# ---------------------------------------------------------------------------- #
+# Retourne la mémoire résidente actuelle du processus en octets
+def get_rss():
+    rss = read_memory_status("VmRSS")
+    return rss if (rss is not None) else get_peak_rss()
+# ============================================================================ #
+
+
+
+# ================================= MESURES ================================== #
+# Ajoute un nombre d'éléments traités à une étape
+def count(name, items):
+    if (enabled):
+        check_process()
+        record = stages.setdefault(name, [0, 0., 0., 0])
+        record[3] += int(items)
+# ---------------------------------------------------------------------------- #
+# Mesure une étape : temps réel, temps processeur et nombre d'appels
+@contextlib.contextmanager
+def stage(name, items = 0):
+    if (not enabled):
+        yield
+        return
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        check_process()
+        record = stages.setdefault(name, [0, 0., 0., 0])
+        record[0] += 1
+        record[1] += time.perf_counter() - wall
+        record[2] += time.process_time() - cpu
+        record[3] += int(items)
+# ---------------------------------------------------------------------------- #
+# Mesure la lecture de chaque lot d'un itérable comme une étape
+def iterate(name, iterable):
+    if (not enabled):
+        return iterable
+    return iterate_measured(name, iter(iterable))
+# ---------------------------------------------------------------------------- #
+# Générateur mesurant chaque élément lu
+def iterate_measured(name, iterator):
+    while True:
+        with stage(name):
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+        count(name, len(batch) if (hasattr(batch, "__len__")) else 1)
+        yield batch
+# ---------------------------------------------------------------------------- #
+# Mesure une unité de travail et son pic de mémoire, avec un profil cProfile
+# optionnel ; le dictionnaire retourné peut recevoir le nombre d'éléments
+@contextlib.contextmanager
+def unit(kind, name):
+    if (not enabled):
+        yield {}
+        return
+    record = {"kind": kind, "name": str(name), "items": 0}
+    profile = cProfile.Profile() if (profile_directory) else None
+    reset_peak_rss()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    if (profile):
+        profile.enable()
+    try:
+        yield record
+    finally:
+        if (profile):
+            profile.disable()
+            filename = kind + "-" + os.path.basename(str(name)) + ".prof"
+            profile.dump_stats(os.path.join(profile_directory, filename))
+        record["wall"] = time.perf_counter() - wall
+        record["cpu"] = time.process_time() - cpu
+        record["peak_rss"] = get_peak_rss()
+        check_process()
+        units.append(record)
+# ---------------------------------------------------------------------------- #
+# Retourne et efface les mesures d'un processus de calcul, pour les transmettre
+# au processus principal qui garde les siennes
+def collect():
+    if (not enabled or os.getpid() == main_process):
+        return None
+    check_process()
+    snapshot = {"stages": dict(stages), "units": list(units)}
+    reset()
+    return snapshot
+# ---------------------------------------------------------------------------- #
+# Ajoute les mesures d'un autre processus
+def merge(snapshot):
+    if (not snapshot):
+        return
+    for name, values in snapshot["stages"].items():
+        record = stages.setdefault(name, [0, 0., 0., 0])
+        for i, value in enumerate(values):
+            record[i] += value
+    units.extend(snapshot["units"])
+# ============================================================================ #
+
+
+
+# ================================= RAPPORTS ================================= #
+# Retourne les mesures sous forme de lignes
+def get_report():
+    return {
+        "stages": [
+            dict(zip(stage_columns, [name] + list(values)))
+            for name, values in sorted(stages.items())
+        ],
+        "units": [
+            {column: record.get(column) for column in unit_columns}
+            for record in units
+        ],
+    }
+# ---------------------------------------------------------------------------- #
+# Écrit les mesures dans un rapport json, ou dans deux fichiers csv pour les
+# étapes et pour les unités de travail
+def write_report(filename):
+    report = get_report()
+    directory = os.path.dirname(filename)
+    if (directory):
+        os.makedirs(directory, exist_ok = True)
+    if (not filename.endswith(".csv")):
+        with open(filename, "w") as stream:
+            json.dump(report, stream, indent = 1)
+        return [filename]
+    filenames = [filename, filename[:-len(".csv")] + "-units.csv"]
+    for output, key, columns in zip(
+        filenames, ["stages", "units"], [stage_columns, unit_columns]
+    ):
+        with open(output, "w", newline = "") as stream:
+            writer = csv.DictWriter(stream, fieldnames = columns)
+            writer.writeheader()
+            writer.writerows(report[key])
+    return filenames
+# ============================================================================ #
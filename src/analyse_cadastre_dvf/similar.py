@@ -0,0 +1,178 @@
+# ================================== SIMILAR ================================= #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         similar.py
+# Description :     Recherche de biens similaires sur les parcelles augmentées
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Aliases
+import numpy as np
+import pandas as pd
+# Projet
+from . import prices
+from . import enhancer
+from . import parcels
+from . import analyzer
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Propriétés des parcelles indexées, la première sert de clé de tri
+features = [
+    "land_area",
+    "building_area",
+    "land_rectangle_min",
+    "land_rectangle_max",
+    "land_ratio",
+    "buildings",
+    "longitude",
+    "latitude",
+]
+# Propriétés comparées par défaut pour les plus proches voisins
+neighbour_features = [
+    "land_area",
+    "building_area",
+    "land_rectangle_min",
+    "land_rectangle_max",
+    "land_ratio",
+    "buildings",
+]
+# ============================================================================ #
+
+
+
+# ================================= CHARGEMENT =============================== #
+# Charge les parcelles augmentées de départements avec leur position
+def load_features(departments = None, enhanced = None, directory = None):
+    lands = analyzer.load_enhanced_lands(departments, None, enhanced)
+    if (departments is None):
+        departments = lands["commune"].map(enhancer.get_city_department)
+        departments = departments.unique()
+    locations = parcels.load_parcels(departments, directory)
+    locations = locations[["id", "longitude", "latitude"]]
+    return lands.merge(locations, on = "id", how = "left")
+# ============================================================================ #
+
+
+
+# ================================= RECHERCHE ================================ #
+# Index des parcelles trié selon la première propriété
+class SimilarityIndex:
+    # Constructeur
+    def __init__(self, df):
+        order = np.argsort(df[features[0]].to_numpy(), kind = "stable")
+        self.lands = df.iloc[order].reset_index(drop = True)
+        self.values = np.vstack([
+            self.lands[name].to_numpy(dtype = np.float64) for name in features
+        ])
+        self.columns = {name: i for i, name in enumerate(features)}
+        self.scales = np.nanstd(self.values, axis = 1)
+        self.scales[~(self.scales > 0)] = 1.
+        self.positions = pd.Index(self.lands["id"])
+        if (not self.positions.is_unique):
+            raise ValueError("Duplicate parcel ids in the similarity index")
+    # Nombre de parcelles
+    def __len__(self):
+        return len(self.lands)
+    # Retourne les positions des parcelles dont les propriétés sont dans des
+    # intervalles fermés donnés sous la forme nom = (minimum, maximum)
+    def select(self, **bounds):
+        start = 0
+        end = len(self)
+        key = self.values[0]
+        low, high = bounds.get(features[0], (None, None))
+        if (low is not None):
+            start = np.searchsorted(key, low, "left")
+        if (high is not None):
+            end = np.searchsorted(key, high, "right")
+        if (not bounds):
+            return np.arange(start, end)
+        mask = np.ones(end - start, dtype = bool)
+        for name, (low, high) in bounds.items():
+            column = self.values[self.columns[name], start:end]
+            if (low is not None):
+                mask &= column >= low
+            if (high is not None):
+                mask &= column <= high
+        return np.nonzero(mask)[0] + start
+    # Retourne les parcelles dont les propriétés sont dans des intervalles
+    def range(self, **bounds):
+        return self.lands.iloc[self.select(**bounds)]
+    # Calcule les distances normalisées de parcelles à des valeurs
+    def distances(self, rows, columns, target, scale):
+        total = np.zeros(len(rows))
+        for column, value, factor in zip(columns, target, scale):
+            total += ((self.values[column][rows] - value) / factor) ** 2
+        return np.sqrt(total)
+    # Retourne les k parcelles les plus proches de valeurs données, en distance
+    # normalisée par l'écart type de chaque propriété, parmi celles
+    # vérifiant éventuellement des intervalles
+    def nearest(self, values, k = 10, bounds = None, weights = None):
+        bounds = bounds if (bounds) else {}
+        weights = weights if (weights) else {}
+        names = [name for name in neighbour_features if name in values]
+        names += [name for name in values if name not in names]
+        columns = [self.columns[name] for name in names]
+        target = np.array([values[name] for name in names], dtype = np.float64)
+        scale = self.scales[columns] / np.array(
+            [weights.get(name, 1.) for name in names]
+        )
+        rows = self.select(**bounds)
+        k = min(k, len(rows))
+        if (k == 0):
+            return self.lands.iloc[[]].assign(similarity_distance = [])
+        # Restreint les candidats autour de la clé de tri : la distance d'une
+        # parcelle est au moins l'écart normalisé de sa clé, sauf si la fenêtre
+        # n'a pas k distances définies
+        if (features[0] in names):
+            keys = self.values[0][rows]
+            center = np.searchsorted(keys, values[features[0]])
+            margin = k + 1024
+            window = rows[max(center - margin, 0):center + margin]
+            limit = np.partition(
+                self.distances(window, columns, target, scale), k - 1
+            )[k - 1]
+            if (np.isfinite(limit)):
+                width = limit * scale[names.index(features[0])]
+                key = values[features[0]]
+                start = np.searchsorted(keys, key - width, "left")
+                end = np.searchsorted(keys, key + width, "right")
+                rows = rows[start:end]
+        # Sélectionne les k plus proches parmi les distances définies
+        distances = self.distances(rows, columns, target, scale)
+        defined = ~np.isnan(distances)
+        rows = rows[defined]
+        distances = distances[defined]
+        k = min(k, len(rows))
+        if (k == 0):
+            return self.lands.iloc[[]].assign(similarity_distance = [])
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best], kind = "stable")]
+        return self.lands.iloc[rows[best]].assign(
+            similarity_distance = distances[best]
+        )
+    # Retourne les k parcelles les plus proches d'une parcelle indexée
+    def nearest_parcel(self, parcel, k = 10, names = None, bounds = None):
+        names = names if (names) else neighbour_features
+        row = self.values[:, self.positions.get_loc(parcel)]
+        values = {name: row[self.columns[name]] for name in names}
+        result = self.nearest(values, k + 1, bounds)
+        return result[result["id"] != parcel].head(k)
+# ---------------------------------------------------------------------------- #
+# Associe aux parcelles trouvées les ventes dvf correspondantes
+def join_sales(lands, sales = None):
+    sales = analyzer.load_preprocessed_file() if (sales is None) else sales
+    sales = prices.add_prices(sales)
+    sales = sales.assign(cadastre_id = analyzer.get_cadastre_ids(sales))
+    lands = lands.rename(columns = {"id": "cadastre_id"})
+    sales = sales.drop(columns = [
+        c for c in sales.columns if c in lands.columns and c != "cadastre_id"
+    ])
+    return lands.merge(sales, on = "cadastre_id", how = "inner")
+# ============================================================================ #
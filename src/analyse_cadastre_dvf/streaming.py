@@ -0,0 +1,83 @@
+# ================================= STREAMING ================================ #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         streaming.py
+# Description :     Lecture incrémentale des fichiers json du cadastre
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import json
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Taille des blocs lus dans le fichier en caractères
+chunk_size = 1024 ** 2
+# Clé de la liste des éléments
+features_key = '"features"'
+# Caractères ignorés entre deux éléments
+separators = " \t\r\n,"
+# ============================================================================ #
+
+
+
+# ================================= LECTURE ================================== #
+# Lit le fichier jusqu'au début de la liste des éléments
+def seek_features(stream, size = chunk_size):
+    buffer = ""
+    while True:
+        position = buffer.find(features_key)
+        if (position >= 0):
+            start = buffer.find("[", position + len(features_key))
+            if (start >= 0):
+                return buffer[start + 1:]
+        chunk = stream.read(size)
+        if (not chunk):
+            raise ValueError("No features found in json stream")
+        buffer += chunk
+# ---------------------------------------------------------------------------- #
+# Itère sur les éléments d'un fichier json sans le charger entièrement
+def iterate_features(filename, size = chunk_size):
+    decoder = json.JSONDecoder()
+    with open(filename) as stream:
+        buffer = seek_features(stream, size)
+        position = 0
+        end = False
+        while True:
+            # Saute les séparateurs entre deux éléments
+            while (position < len(buffer) and buffer[position] in separators):
+                position += 1
+            if (position < len(buffer) and buffer[position] == "]"):
+                return
+            # Décode l'élément suivant si il est complet dans le tampon
+            try:
+                if (position >= len(buffer)):
+                    raise json.JSONDecodeError("Empty buffer", buffer, position)
+                feature, position = decoder.raw_decode(buffer, position)
+                yield feature
+            # Sinon complète le tampon
+            except json.JSONDecodeError:
+                if (end):
+                    raise
+                chunk = stream.read(max(size, len(buffer) - position))
+                end = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+# ---------------------------------------------------------------------------- #
+# Itère sur des lots d'éléments de taille fixe d'un fichier json
+def iterate_batches(filename, batch_size, size = chunk_size):
+    batch = []
+    for feature in iterate_features(filename, size):
+        batch.append(feature)
+        if (len(batch) >= batch_size):
+            yield batch
+            batch = []
+    if (batch):
+        yield batch
+# ============================================================================ #
@@ -0,0 +1,187 @@
+# =============================== TEST ANALYZER ============================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_analyzer.py
+# Description :     Tests du prétraitement des données dvf
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import sys
+import subprocess
+# Aliases
+import numpy as np
+import pandas as pd
+import datetime as dt
+import pytest
+# Projet
+from analyse_cadastre_dvf import analyzer
+from analyse_cadastre_dvf import benchmark
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Filtres de l'ancienne sauvegarde, appliqués au prétraitement de référence
+def filter_reference(df):
+    df = df[df["Type local"] == "Maison"]
+    dates = [
+        dt.date(*[int(x) for x in reversed(date.split("/"))])
+        for date in df["Date mutation"]
+    ]
+    df = df[np.array(dates, dtype = object) < analyzer.death_date]
+    df = df[df["Nombre de lots"].apply(lambda x: int(x)) == 0]
+    df = df[df["Valeur fonciere"].apply(lambda x: float(x)) > 0.]
+    df = df[df["Surface reelle bati"].apply(lambda x: int(x)) > 0]
+    df = df[df["Surface terrain"].apply(lambda x: int(x)) > 0]
+    return df.reset_index(drop = True)
+# ---------------------------------------------------------------------------- #
+# Trie des ventes dans un ordre indépendant du stockage, les catégories étant
+# converties en chaînes de caractères
+def sort_sales(df, columns = None):
+    df = df[columns] if (columns is not None) else df
+    df = df.astype({
+        c: str for c in df.columns
+        if isinstance(df[c].dtype, pd.CategoricalDtype)
+    })
+    return df.sort_values(list(df.columns)).reset_index(drop = True)
+# ---------------------------------------------------------------------------- #
+# Génère des fichiers dvf annuels dans le dossier de données du test
+@pytest.fixture
+def dvf_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return benchmark.generate_dvf_files(8000, [2014, 2015, 2016, 2017])
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# Le prétraitement vectorisé et son masque de filtres donnent les mêmes ventes
+# que l'ancienne version
+def test_filter_matches_reference(tmp_path):
+    filename = benchmark.generate_dvf_file(str(tmp_path / "dvf.txt"), 6000)
+    reference = benchmark.preprocess_dvf_files_reference(filename)
+    df = analyzer.preprocess_dvf_files(filename)
+    assert df["id"].tolist() == reference["id"].tolist()
+    reference = filter_reference(reference)
+    df = analyzer.filter_dvf(df).reset_index(drop = True)
+    assert len(df) > 0
+    assert df["id"].tolist() == reference["id"].tolist()
+    for column in ["Valeur fonciere", "Surface reelle bati", "Surface terrain"]:
+        assert np.allclose(df[column], reference[column].astype(float))
+    for column in ["Jour", "Mois", "Annee"]:
+        assert (df[column] == reference[column].astype(int)).all()
+    assert "Nombre de lots" not in df.columns
+# ---------------------------------------------------------------------------- #
+# Le prétraitement en parallèle donne le même tableau que le traitement en
+# série et que le traitement pandas de tous les fichiers à la fois
+def test_parallel_matches_serial(dvf_files):
+    serial = analyzer.preprocess_dvf_files_parallel(dvf_files, 1)
+    parallel = analyzer.preprocess_dvf_files_parallel(dvf_files, 4)
+    pd.testing.assert_frame_equal(serial, parallel)
+    df = analyzer.filter_dvf(analyzer.preprocess_dvf_files(dvf_files))
+    df = df.reset_index(drop = True)
+    assert len(df) > 0
+    pd.testing.assert_frame_equal(
+        serial, df[serial.columns], check_categorical = False
+    )
+# ---------------------------------------------------------------------------- #
+# Les ventes sauvegardées par département et par année se relisent à
+# l'identique, et les filtres transmis au lecteur équivalent à ceux de pandas
+def test_preprocessed_dataset(dvf_files):
+    analyzer.save_preprocessed_file(processes = 1)
+    path = analyzer.get_dvf_directory() + analyzer.preprocessed_file
+    assert sorted(os.listdir(path)) == [
+        "01", "13", "2A", "33", "69", "75", "971"
+    ]
+    assert sorted(os.listdir(os.path.join(path, "2A"))) == [
+        "2014", "2015", "2016", "2017"
+    ]
+    expected = analyzer.preprocess_dvf_files_parallel(dvf_files, 1)
+    df = analyzer.load_preprocessed_file()
+    assert len(df) == len(expected)
+    pd.testing.assert_frame_equal(
+        sort_sales(df, expected.columns), sort_sales(expected)
+    )
+    # Filtres et projection
+    columns = ["id", "Date mutation", "Valeur fonciere", "Code departement"]
+    filtered = analyzer.load_preprocessed_file(
+        columns = columns,
+        departments = ["2A", 971],
+        start = "2015-03-01",
+        end = "2016-07-01",
+        minimum = 100000.,
+        maximum = 500000.
+    )
+    mask = df["Code departement"].isin(["2A", "971"])
+    mask &= df["Date mutation"] >= pd.Timestamp("2015-03-01")
+    mask &= df["Date mutation"] < pd.Timestamp("2016-07-01")
+    mask &= df["Valeur fonciere"].between(100000., 500000.)
+    assert list(filtered.columns) == columns
+    assert 0 < len(filtered) < len(df)
+    pd.testing.assert_frame_equal(
+        sort_sales(filtered), sort_sales(df[mask], columns)
+    )
+# ---------------------------------------------------------------------------- #
+# La mise à jour incrémentale ne retraite que les fichiers sources modifiés et
+# donne les mêmes ventes qu'une reconstruction complète
+def test_refresh_preprocessed_file(dvf_files):
+    names = [os.path.basename(f) for f in dvf_files]
+    assert analyzer.refresh_preprocessed_file(processes = 2) == (names, [], [])
+    assert analyzer.refresh_preprocessed_file() == ([], names, [])
+    # Fichier touché sans changement de contenu
+    status = os.stat(dvf_files[0])
+    mtime = status.st_mtime_ns + 10 ** 9
+    os.utime(dvf_files[0], ns = (status.st_atime_ns, mtime))
+    assert analyzer.refresh_preprocessed_file() == ([], names, [])
+    # Fichier réécrit et fichier supprimé
+    random = np.random.default_rng(1)
+    benchmark.generate_dvf_file(dvf_files[2], 2000, 2016, random)
+    os.remove(dvf_files[1])
+    updated, reused, removed = analyzer.refresh_preprocessed_file(processes = 2)
+    assert updated == [names[2]]
+    assert reused == [names[0], names[3]]
+    assert removed == [names[1]]
+    # Comparaison à une reconstruction complète
+    analyzer.save_preprocessed_file("complet", processes = 1)
+    pd.testing.assert_frame_equal(
+        sort_sales(analyzer.load_preprocessed_file()),
+        sort_sales(analyzer.load_preprocessed_file("complet"))
+    )
+# ---------------------------------------------------------------------------- #
+# Les ventes sont associées aux parcelles par identifiant du cadastre, y compris
+# en outre-mer où le code commune dvf a un chiffre de plus
+def test_join_enhanced_lands():
+    df = pd.DataFrame({
+        "id": ["010010000A0001", "971001000AB0012", "010010000A0002"],
+        "Code departement": ["01", "971", "01"],
+        "Valeur fonciere": [1., 2., 3.],
+    })
+    lands = pd.DataFrame({
+        "id": ["010010000A0001", "97101000AB0012"],
+        "land_area": [10., 20.],
+    })
+    result = analyzer.join_enhanced_lands(df, lands)
+    assert result["id"].tolist() == df["id"].tolist()
+    assert result["land_area"].tolist()[:2] == [10., 20.]
+    assert result["land_area"].isna().tolist() == [False, False, True]
+    assert "cadastre_id" not in result.columns
+# ---------------------------------------------------------------------------- #
+# Le module dvf ne dépend pas de la pile géométrique du cadastre
+def test_analyzer_does_not_import_geometry():
+    directory = os.path.dirname(os.path.dirname(analyzer.__file__))
+    code = "import sys, analyse_cadastre_dvf.analyzer\n"
+    code += "print(sorted(set(sys.modules) & {'shapely', "
+    code += "'analyse_cadastre_dvf.parcels', 'analyse_cadastre_dvf.enhancer'}))"
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env = dict(os.environ, PYTHONPATH = directory),
+        capture_output = True, text = True, check = True
+    ).stdout
+    assert output.strip() == "[]"
+# ============================================================================ #
@@ -0,0 +1,91 @@
+# ================================ TEST CACHE ================================ #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_cache.py
+# Description :     Tests du cache colonnaire des fichiers json du cadastre
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import json
+# Aliases
+import numpy as np
+import pytest
+import shapely as sp
+# Projet
+from analyse_cadastre_dvf import cache
+from analyse_cadastre_dvf import benchmark
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Écrit une collection d'éléments dans un fichier json
+def write_features(filename, features):
+    with open(filename, "w") as stream:
+        json.dump({"type": "FeatureCollection", "features": features}, stream)
+    return filename
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# Les éléments relus depuis le cache, à froid puis à chaud, sont identiques à
+# ceux de json.load, y compris sans identifiant et sur plusieurs lots
+@pytest.mark.parametrize("kind", ["parcelles", "batiments"])
+def test_features_match_json(tmp_path, monkeypatch, kind):
+    monkeypatch.setattr(cache, "parse_batch_size", 7)
+    lands, buildings = benchmark.generate_city("01001", 5)
+    features = {"parcelles": lands, "batiments": buildings}[kind]
+    filename = write_features(str(tmp_path / (kind + ".json")), features)
+    with open(filename) as stream:
+        expected = json.load(stream)["features"]
+    assert len(expected) > 3 * cache.parse_batch_size
+    directory = str(tmp_path / "cache")
+    for attempt in ["froid", "chaud"]:
+        loaded = cache.load_features(filename, directory)
+        assert loaded.table.column(cache.id_column).num_chunks > 1
+        assert len(loaded) == len(expected)
+        assert list(loaded) == expected
+        assert [loaded[i] for i in [0, 8, -1]] == [
+            expected[i] for i in [0, 8, -1]
+        ]
+        batches = list(loaded.batches(10))
+        assert [len(x) for x in batches[:-1]] == [10] * (len(batches) - 1)
+        assert [x for batch in batches for x in batch] == expected
+        assert loaded.ids() == [x.get("id") for x in expected]
+        assert all(sp.equals(
+            loaded.shapes(),
+            sp.from_geojson([json.dumps(x["geometry"]) for x in expected])
+        ))
+    assert len(os.listdir(directory)) == 1
+# ---------------------------------------------------------------------------- #
+# Un élément sans identifiant ne reçoit pas de clé id vide
+def test_features_without_id(tmp_path):
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [
+                [[2.5, 46.5], [2.6, 46.5], [2.6, 46.6], [2.5, 46.5]]
+            ]},
+            "properties": {"nom": "a"},
+        },
+        {
+            "type": "Feature",
+            "id": "b",
+            "geometry": {"type": "MultiPolygon", "coordinates": [
+                [[[2.6, 46.6], [2.7, 46.6], [2.7, 46.7], [2.6, 46.6]]]
+            ]},
+            "properties": {"nom": "b"},
+        },
+    ]
+    filename = write_features(str(tmp_path / "polygones.json"), features)
+    loaded = list(cache.load_features(filename, str(tmp_path / "cache")))
+    assert loaded == features
+    assert "id" not in loaded[0]
+# ============================================================================ #
@@ -0,0 +1,104 @@
+# =============================== TEST INDEXER =============================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_indexer.py
+# Description :     Tests de l'index départemental des bâtiments
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import json
+# Aliases
+import numpy as np
+import shapely as sp
+import shapely.geometry as geom
+# Projet
+from analyse_cadastre_dvf import indexer
+from analyse_cadastre_dvf import enhancer
+from analyse_cadastre_dvf import benchmark
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Écrit les bâtiments d'une commune dans un dossier du cadastre
+def write_buildings(root, insee, shapes):
+    directory = enhancer.get_city_directory(insee, root)
+    os.makedirs(directory, exist_ok = True)
+    features = [
+        {"type": "Feature", "geometry": geom.mapping(shape), "properties": {}}
+        for shape in shapes
+    ]
+    filename = enhancer.get_filename(directory, insee, "batiments")
+    with open(filename, "w") as stream:
+        json.dump({"type": "FeatureCollection", "features": features}, stream)
+# ---------------------------------------------------------------------------- #
+# Retourne un petit bâtiment près du premier coin d'une parcelle
+def make_corner_building(land):
+    ring = np.array(land["geometry"]["coordinates"][0])
+    diagonal = ring[2] - ring[0]
+    corner = ring[0] + 0.1 * diagonal
+    return sp.box(*corner, *(corner + 0.05 * diagonal))
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# Les bâtiments à cheval sur un département voisin sont comptés dans les
+# parcelles de la commune, et les départements éloignés ne sont pas chargés
+def test_border_buildings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = str(tmp_path / "cadastre")
+    benchmark.generate_city_files(root, "01001", 6)
+    city = enhancer.load_city("01001", root)
+    land = city["parcelles"][0]
+    border = make_corner_building(land)
+    write_buildings(root, "02001", [border])
+    write_buildings(root, "03001", [sp.box(20., 40., 20.001, 40.001)])
+    # Index de tous les départements, et du seul département de la commune
+    directory = str(tmp_path / "index")
+    local = str(tmp_path / "local")
+    assert not indexer.build_index(root = root, directory = directory)
+    assert not indexer.build_index(["01"], root = root, directory = local)
+    before = enhancer.enhance_city("01001", root, index = local).to_pandas()
+    after = enhancer.enhance_city("01001", root, index = directory).to_pandas()
+    # Seule la parcelle touchée par le bâtiment voisin change
+    changed = before["buildings"] != after["buildings"]
+    assert after["id"][changed].tolist() == [land["id"]]
+    assert (after["buildings"] - before["buildings"])[changed].tolist() == [1]
+    assert (after["building_area"] > before["building_area"])[changed].all()
+    index = indexer.open_index(directory)
+    assert [os.path.basename(x) for x in index.filenames] == [
+        "batiments-01.arrow", "batiments-02.arrow", "batiments-03.arrow"
+    ]
+    assert index.keys[2] is None
+# ---------------------------------------------------------------------------- #
+# Les requêtes de l'index donnent les mêmes paires qu'un arbre shapely
+def test_query_matches_tree(tmp_path):
+    random = np.random.default_rng(0)
+    x = random.uniform(2., 2.1, 3000)
+    y = random.uniform(48., 48.1, 3000)
+    width = random.uniform(1e-5, 3e-4, 3000)
+    shapes = sp.box(x, y, x + width, y + width)
+    table = indexer.make_index_table(shapes, ["01001"] * len(shapes))
+    directory = str(tmp_path)
+    indexer.cache.write_table(table, indexer.get_index_file("01", directory))
+    index = indexer.BuildingsIndex([indexer.get_index_file("01", directory)])
+    tree = sp.STRtree(index.geometries.take(np.arange(len(index))))
+    queries = sp.buffer(sp.points(
+        random.uniform(2., 2.1, 500), random.uniform(48., 48.1, 500)
+    ), 5e-4)
+    for predicate in [None, "intersects", "contains"]:
+        pairs = index.query(queries, predicate)
+        expected = tree.query(queries, predicate)
+        assert set(map(tuple, pairs.T)) == set(map(tuple, expected.T))
+    for query in queries[:20]:
+        assert set(index.query(query, "intersects")) == set(
+            tree.query(query, "intersects")
+        )
+# ============================================================================ #
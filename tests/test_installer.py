@@ -0,0 +1,305 @@
+# ============================== TEST INSTALLER ============================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_installer.py
+# Description :     Tests de l'exploration et du téléchargement sur un serveur
+#                   http local
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import gzip
+import random
+import hashlib
+import socket
+import functools
+import threading
+import http.server
+# Aliases
+import pytest
+# Projet
+from analyse_cadastre_dvf import cli
+from analyse_cadastre_dvf import enhancer
+from analyse_cadastre_dvf import installer
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Départements et nombre de communes du miroir local
+departments = {"01": 12, "02": 7, "2A": 5, "971": 4}
+# Couches de chaque commune
+layers = ["batiments", "communes", "feuilles", "parcelles", "sections"]
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Serveur de fichiers statiques silencieux
+class StaticHandler(http.server.SimpleHTTPRequestHandler):
+    # Ne journalise pas les requêtes
+    def log_message(self, *arguments):
+        pass
+# ---------------------------------------------------------------------------- #
+# Serveur de fichiers en mémoire gérant les reprises, les redirections et les
+# coupures de connexion programmées
+class FilesHandler(http.server.BaseHTTPRequestHandler):
+    # Paramètres
+    protocol_version = "HTTP/1.1"
+    files = {}
+    cuts = {}
+    requests = []
+    # Ne journalise pas les requêtes
+    def log_message(self, *arguments):
+        pass
+    # Envoie une réponse sans contenu
+    def send_empty(self, status, headers = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    # Répond à une requête
+    def do_GET(self):
+        name = self.path.strip("/")
+        interval = self.headers.get("Range")
+        self.requests.append((name, interval))
+        if (name.startswith("redirect/")):
+            return self.send_empty(302, {"Location": "/" + name[9:]})
+        if (name not in self.files):
+            return self.send_empty(404)
+        data = self.files[name]
+        start = int(interval.partition("=")[2].rstrip("-")) if (interval) else 0
+        if (start >= len(data) > 0):
+            return self.send_empty(416, {
+                "Content-Range": "bytes */" + str(len(data))
+            })
+        self.send_response(206 if (start) else 200)
+        if (start):
+            self.send_header("Content-Range", "bytes " + str(start) + "-"
+                + str(len(data) - 1) + "/" + str(len(data)))
+        body = data[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # Coupure de la connexion au milieu du transfert
+        if (self.cuts.get(name, 0) > 0):
+            self.cuts[name] -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(body)
+# ---------------------------------------------------------------------------- #
+# Créé un serveur de fichiers en mémoire avec ses coupures programmées
+def make_files_handler(files, cuts = None):
+    return type("Handler", (FilesHandler,), {
+        "files": files, "cuts": dict(cuts or {}), "requests": []
+    })
+# ---------------------------------------------------------------------------- #
+# Créé un serveur de fichiers statiques sur un répertoire
+def make_static_handler(directory):
+    return functools.partial(StaticHandler, directory = directory)
+# ---------------------------------------------------------------------------- #
+# Génère des données aléatoires reproductibles
+def make_data(size, seed = 0):
+    return random.Random(seed).randbytes(size)
+# ---------------------------------------------------------------------------- #
+# Lance des serveurs http locaux et retourne leur adresse
+@pytest.fixture
+def serve():
+    servers = []
+    # Démarre un serveur avec un gestionnaire de requêtes
+    def start(handler):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(
+            target = server.serve_forever, args = (0.05,), daemon = True
+        ).start()
+        servers.append(server)
+        return "http://127.0.0.1:" + str(server.server_address[1])
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+# ---------------------------------------------------------------------------- #
+# Écrit une page d'index dans le style nginx, avec un lien vers le parent
+def write_index(directory):
+    entries = sorted(
+        entry + "/" if os.path.isdir(os.path.join(directory, entry)) else entry
+        for entry in os.listdir(directory)
+    )
+    page = "<html><body><h1>Index</h1><hr><pre><a href=\"../\">../</a>\n"
+    for entry in entries:
+        page += "<a href=\"" + entry + "\">" + entry + "</a>  -\n"
+    page += "</pre><hr></body></html>"
+    with open(os.path.join(directory, "index.html"), "w") as stream:
+        stream.write(page)
+# ---------------------------------------------------------------------------- #
+# Crée un miroir du cadastre etalab et retourne les chemins des fichiers
+def make_cadastre_mirror(root, parent_links):
+    files = []
+    level = os.path.join(
+        root, "data", "etalab-cadastre", "2017-07-06", "geojson", "communes"
+    )
+    for department, count in departments.items():
+        for i in range(count):
+            insee = department + str(i + 1).zfill(5 - len(department))
+            directory = os.path.join(level, department, insee)
+            os.makedirs(directory)
+            for layer in layers:
+                name = "cadastre-" + insee + "-" + layer + ".json.gz"
+                with open(os.path.join(directory, name), "w") as stream:
+                    stream.write(layer)
+                files.append(os.path.relpath(
+                    os.path.join(directory, name), root
+                ).replace(os.sep, "/"))
+    if (parent_links):
+        for directory, _, _ in os.walk(root):
+            write_index(directory)
+    return files
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# L'exploration retrouve tous les fichiers, avec ou sans liens vers le parent
+@pytest.mark.parametrize("parent_links", [True, False])
+def test_explore_etalab_cadastre(tmp_path, serve, parent_links):
+    expected = make_cadastre_mirror(str(tmp_path), parent_links)
+    address = serve(make_static_handler(str(tmp_path)))
+    files = installer.explore_etalab_cadastre(
+        address + "/data/etalab-cadastre", processes = 4
+    )
+    assert sorted(files) == sorted(address + "/" + x for x in expected)
+# ---------------------------------------------------------------------------- #
+# Un téléchargement partiel reprend là où il s'était arrêté
+def test_download_resumes_partial_file(tmp_path, serve):
+    data = make_data(100000)
+    handler = make_files_handler({"file.bin": data})
+    address = serve(handler)
+    filename = str(tmp_path / "file.bin")
+    with open(filename + ".part", "wb") as stream:
+        stream.write(data[:30000])
+    received = installer.download_file(address + "/file.bin", filename)
+    assert received == 70000
+    assert handler.requests == [("file.bin", "bytes=30000-")]
+    assert open(filename, "rb").read() == data
+    assert not os.path.exists(filename + ".part")
+# ---------------------------------------------------------------------------- #
+# Un fichier partiel déjà complet est validé sans nouveau transfert
+def test_download_complete_partial_file(tmp_path, serve):
+    data = make_data(5000)
+    address = serve(make_files_handler({"file.bin": data}))
+    filename = str(tmp_path / "file.bin")
+    with open(filename + ".part", "wb") as stream:
+        stream.write(data)
+    assert installer.download_file(address + "/file.bin", filename) == 0
+    assert open(filename, "rb").read() == data
+# ---------------------------------------------------------------------------- #
+# Une connexion coupée en plein transfert est reprise avec une requête partielle
+def test_download_retries_cut_connection(tmp_path, serve):
+    data = make_data(200000)
+    handler = make_files_handler({"file.bin": data}, {"file.bin": 2})
+    address = serve(handler)
+    filename = str(tmp_path / "file.bin")
+    installer.download_file_retrying(
+        address + "/file.bin", filename, len(data), backoff = 0
+    )
+    assert handler.requests == [
+        ("file.bin", None),
+        ("file.bin", "bytes=100000-"),
+        ("file.bin", "bytes=150000-"),
+    ]
+    assert open(filename, "rb").read() == data
+# ---------------------------------------------------------------------------- #
+# Un fichier absent échoue définitivement, sans nouvelle tentative
+def test_download_missing_file(tmp_path, serve):
+    handler = make_files_handler({})
+    address = serve(handler)
+    filename = str(tmp_path / "missing.bin")
+    with pytest.raises(installer.DownloadError) as error:
+        installer.download_file_retrying(
+            address + "/missing.bin", filename, backoff = 0
+        )
+    assert error.value.permanent
+    assert len(handler.requests) == 1
+    assert not os.path.exists(filename)
+    assert not os.path.exists(filename + ".part")
+# ---------------------------------------------------------------------------- #
+# Les redirections sont suivies, dans une limite donnée
+def test_download_follows_redirections(tmp_path, serve):
+    data = make_data(10000)
+    handler = make_files_handler({"file.bin": data})
+    address = serve(handler)
+    filename = str(tmp_path / "file.bin")
+    installer.download_file(address + "/redirect/redirect/file.bin", filename)
+    assert open(filename, "rb").read() == data
+    assert [x[0] for x in handler.requests] == [
+        "redirect/redirect/file.bin", "redirect/file.bin", "file.bin"
+    ]
+    with pytest.raises(installer.DownloadError):
+        installer.open_url(
+            address + "/redirect/redirect/file.bin", redirections = 1
+        )
+# ---------------------------------------------------------------------------- #
+# Un fichier gzip en plusieurs membres est décompressé à l'identique, même après
+# une coupure qui impose de recommencer depuis le début
+def test_download_decompresses_gzip(tmp_path, serve):
+    data = make_data(300000)
+    compressed = gzip.compress(data[:100000]) + gzip.compress(data[100000:])
+    handler = make_files_handler(
+        {"file.json.gz": compressed}, {"file.json.gz": 1}
+    )
+    address = serve(handler)
+    filename = str(tmp_path / "file.json")
+    installer.download_file_retrying(
+        address + "/file.json.gz", filename,
+        checksum = hashlib.sha256(compressed).hexdigest(),
+        decompress = True, backoff = 0
+    )
+    assert [x[1] for x in handler.requests] == [None, None]
+    assert open(filename, "rb").read() == data
+# ---------------------------------------------------------------------------- #
+# Une liste de fichiers est téléchargée et décompressée dans les données
+def test_download_list(tmp_path, serve, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    files = {
+        "data/etalab-cadastre/01/a.json.gz": gzip.compress(make_data(5000, 1)),
+        "data/etalab-cadastre/01/b.json.gz": gzip.compress(make_data(7000, 2)),
+        "data/etalab-cadastre/02/c.bin": make_data(3000, 3),
+    }
+    address = serve(make_files_handler(files))
+    links = [address + "/" + name for name in files]
+    failures = installer.download_list(
+        links + [address + "/missing.bin"], "etalab-cadastre", processes = 2
+    )
+    assert list(failures) == [address + "/missing.bin"]
+    for link, name in zip(links, files):
+        path = installer.get_download_path(link, "etalab-cadastre")
+        if (name.endswith(".gz")):
+            content = gzip.decompress(files[name])
+            path = path.replace(".gz", "")
+        else:
+            content = files[name]
+        assert open(path, "rb").read() == content
+# ---------------------------------------------------------------------------- #
+# La commande de téléchargement place les fichiers là où l'analyse les lit
+def test_cli_download_feeds_cadastre_directory(tmp_path, serve, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    name = "data/etalab-cadastre/2017-07-06/geojson/communes/01/01001/"
+    name += "cadastre-01001-batiments.json.gz"
+    data = make_data(4000)
+    address = serve(make_files_handler({name: gzip.compress(data)}))
+    os.makedirs(installer.get_data_directory())
+    filename = installer.save_list([address + "/" + name], "etalab-cadastre")
+    assert cli.main(["download", filename, "--processes", "1"]) == 0
+    directory = enhancer.get_city_directory("01001")
+    with open(directory + "cadastre-01001-batiments.json", "rb") as stream:
+        assert stream.read() == data
+# ============================================================================ #
@@ -0,0 +1,103 @@
+# =============================== TEST METRICS =============================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_metrics.py
+# Description :     Précision des propriétés vectorisées par rapport au calcul
+#                   géodésique de geographiclib
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Aliases
+import numpy as np
+import pytest
+import shapely.geometry as geom
+from geographiclib.geodesic import Geodesic
+# Projet
+from analyse_cadastre_dvf import metrics
+from analyse_cadastre_dvf import enhancer
+# ============================================================================ #
+
+
+
+# ================================ PARAMETRES ================================ #
+# Centre des parcelles générées
+center = (2.5, 46.5)
+# Propriétés comparées aux longueurs géodésiques
+lengths = ["perimeter", "rectangle_min", "rectangle_max", "rectangle_perimeter"]
+# Erreurs relatives documentées selon la distance au centre en km
+tolerances = [(50, 2e-5), (100, 6e-5), (300, 5e-4)]
+# Erreur relative documentée sur les aires
+area_tolerance = 5e-6
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Génère des parcelles quadrilatères irrégulières de 10 à 300 m de côté,
+# réparties jusqu'à une distance donnée du centre
+def generate_parcels(distance, count = 200, seed = 0):
+    random = np.random.default_rng(seed)
+    features = []
+    for i in range(count):
+        radius = distance * 1000. * np.sqrt(random.uniform())
+        position = Geodesic.WGS84.Direct(
+            center[1], center[0], random.uniform(-180., 180.), radius
+        )
+        longitude, latitude = position["lon2"], position["lat2"]
+        width, height = random.uniform(10., 300., 2)
+        angle = random.uniform(0., np.pi)
+        ring = []
+        for u, v in [(0., 0.), (width, 0.), (width, height), (0., height)]:
+            u += random.uniform(-0.2, 0.2) * width
+            v += random.uniform(-0.2, 0.2) * height
+            x = u * np.cos(angle) - v * np.sin(angle)
+            y = u * np.sin(angle) + v * np.cos(angle)
+            ring.append((
+                longitude + x / (111320. * np.cos(np.radians(latitude))),
+                latitude + y / 111132.
+            ))
+        ring.append(ring[0])
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": {},
+        })
+    return features
+# ---------------------------------------------------------------------------- #
+# Calcule l'erreur relative maximale de chaque propriété par rapport au calcul
+# géodésique de enhancer.Polygon
+def get_errors(features, center = None):
+    computed = metrics.compute_features_metrics(features, center)
+    polygons = [
+        enhancer.Polygon(geom.shape(feature["geometry"]))
+        for feature in features
+    ]
+    errors = {}
+    for name in ["area"] + lengths:
+        reference = np.array([getattr(x, name) for x in polygons])
+        errors[name] = np.max(np.abs(computed[name] - reference) / reference)
+    return errors
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# Les erreurs relatives restent sous les bornes documentées selon l'emprise
+@pytest.mark.parametrize("distance, tolerance", tolerances)
+def test_metrics_error_bounds(distance, tolerance):
+    errors = get_errors(generate_parcels(distance), center)
+    assert errors["area"] < area_tolerance
+    for name in lengths:
+        assert errors[name] < tolerance, name
+# ---------------------------------------------------------------------------- #
+# Une commune avec le centre arrondi par défaut reste dans la première borne
+def test_metrics_default_center():
+    errors = get_errors(generate_parcels(5))
+    assert errors["area"] < area_tolerance
+    for name in lengths:
+        assert errors[name] < tolerances[0][1], name
+# ============================================================================ #
@@ -0,0 +1,113 @@
+# ============================== TEST PROFILER =============================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_profiler.py
+# Description :     Tests des mesures par étape et par unité de travail
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import os
+import json
+import multiprocessing
+# Aliases
+import pytest
+# Projet
+from analyse_cadastre_dvf import analyzer
+from analyse_cadastre_dvf import enhancer
+from analyse_cadastre_dvf import profiler
+from analyse_cadastre_dvf import benchmark
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Désactive les mesures après chaque test
+@pytest.fixture(autouse = True)
+def disabled_profiler():
+    yield
+    profiler.disable()
+    profiler.reset()
+# ---------------------------------------------------------------------------- #
+# Tâche d'un processus : mesure une étape et retourne les mesures
+def record_stage(name):
+    with profiler.stage(name, 1):
+        pass
+    return profiler.collect()
+# ---------------------------------------------------------------------------- #
+# Charge un rapport json indexé par étape
+def load_report(filename):
+    with open(filename) as stream:
+        report = json.load(stream)
+    return {x["stage"]: x for x in report["stages"]}, report["units"]
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# Une nouvelle activation repart de mesures vides
+def test_enable_resets_measures():
+    profiler.enable()
+    with profiler.stage("first", 3):
+        pass
+    profiler.enable()
+    with profiler.stage("second"):
+        pass
+    assert list(profiler.stages) == ["second"]
+    assert profiler.collect() is None
+# ---------------------------------------------------------------------------- #
+# Un processus créé par fork ne renvoie pas les mesures de son parent
+def test_forked_worker_returns_only_its_measures():
+    profiler.enable()
+    with profiler.stage("parent"):
+        pass
+    context = multiprocessing.get_context("fork")
+    with context.Pool(1) as pool:
+        snapshots = pool.map(record_stage, ["worker", "worker"])
+    for snapshot in snapshots:
+        profiler.merge(snapshot)
+    assert profiler.stages["parent"][0] == 1
+    assert profiler.stages["worker"][0] == 2
+# ---------------------------------------------------------------------------- #
+# Deux analyses mesurées à la suite ont chacune leur propre rapport
+def test_consecutive_profiled_pipelines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = str(tmp_path / "cadastre")
+    benchmark.generate_city_files(root, "01001", 8)
+    benchmark.generate_dvf_files(4000, [2016, 2017])
+    enhancer.enhance_cities(
+        ["01001"], root, processes = 2, report = "enhance.json"
+    )
+    assert not profiler.enabled
+    assert profiler.enabled_variable not in os.environ
+    analyzer.save_preprocessed_file(processes = 2, report = "dvf.json")
+    assert not profiler.enabled
+    # Analyse du cadastre
+    stages, units = load_report("enhance.json")
+    assert stages["buildings_tree"]["calls"] == 1
+    assert stages["land_metrics"]["items"] == 64
+    assert [unit["name"] for unit in units] == ["01001"]
+    # Prétraitement des dvf, sans les mesures de l'analyse précédente
+    stages, units = load_report("dvf.json")
+    assert "buildings_tree" not in stages
+    assert stages["read_dvf"]["calls"] == 2
+    assert stages["read_dvf"]["items"] == 4000
+    assert stages["write_dvf"]["calls"] == 1
+    assert sorted(unit["kind"] for unit in units) == ["dvf", "dvf"]
+# ---------------------------------------------------------------------------- #
+# Les mesures sont désactivées à la fin d'une analyse, même en cas d'erreur
+def test_profiling_disabled_after_failure(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for function in [
+        analyzer.save_preprocessed_file, analyzer.refresh_preprocessed_file
+    ]:
+        with pytest.raises(FileNotFoundError):
+            function(processes = 1, profile = str(tmp_path / "profiles"))
+        assert not profiler.enabled
+        assert profiler.enabled_variable not in os.environ
+        assert profiler.profile_variable not in os.environ
+# ============================================================================ #
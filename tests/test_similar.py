@@ -0,0 +1,87 @@
+# =============================== TEST SIMILAR =============================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_similar.py
+# Description :     Tests de la recherche de biens similaires
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Aliases
+import numpy as np
+import pandas as pd
+import pytest
+# Projet
+from analyse_cadastre_dvf import similar
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Génère des parcelles augmentées aléatoires, sans bâtiment connu pour les
+# surfaces entre 400 et 700 m2 et avec quelques propriétés manquantes
+def generate_lands(count = 20000, seed = 0):
+    random = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "id": ["01001000A" + str(i).zfill(6) for i in range(count)],
+        "land_area": random.uniform(0., 1000., count),
+        "building_area": random.uniform(0., 300., count),
+        "land_rectangle_min": random.uniform(5., 30., count),
+        "land_rectangle_max": random.uniform(30., 80., count),
+        "land_ratio": random.uniform(0., 1., count),
+        "buildings": random.integers(0, 5, count).astype(float),
+        "longitude": random.uniform(2., 3., count),
+        "latitude": random.uniform(46., 47., count),
+    })
+    df.loc[df["land_area"].between(400., 700.), "building_area"] = np.nan
+    df.loc[random.uniform(size = count) < 0.02, "land_ratio"] = np.nan
+    df.loc[random.uniform(size = count) < 0.01, "land_area"] = np.nan
+    return df
+# ---------------------------------------------------------------------------- #
+# Recherche exhaustive des k plus proches parcelles aux distances définies
+def nearest_reference(index, values, k, bounds = None):
+    df = index.lands
+    mask = np.ones(len(df), dtype = bool)
+    for name, (low, high) in (bounds or {}).items():
+        mask &= (df[name] >= low).to_numpy() & (df[name] <= high).to_numpy()
+    total = np.zeros(len(df))
+    for name, value in values.items():
+        scale = index.scales[index.columns[name]]
+        total += ((df[name].to_numpy() - value) / scale) ** 2
+    distances = np.sqrt(total)
+    rows = np.nonzero(mask & ~np.isnan(distances))[0]
+    rows = rows[np.argsort(distances[rows], kind = "stable")][:k]
+    return df["id"].iloc[rows].tolist(), distances[rows]
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# Les plus proches voisins sont ceux d'une recherche exhaustive, y compris
+# quand les propriétés autour de la clé de tri sont manquantes
+@pytest.mark.parametrize("values, bounds", [
+    ({"land_area": 150., "building_area": 80., "land_ratio": 0.4}, None),
+    ({"land_area": 850., "buildings": 2., "land_rectangle_min": 12.}, None),
+    ({"land_area": 550., "building_area": 80.}, None),
+    ({"land_area": 550., "building_area": 80.}, {"land_area": (300., 800.)}),
+    ({"building_area": 120., "land_ratio": 0.7}, {"buildings": (1., 3.)}),
+])
+def test_nearest_matches_brute_force(values, bounds):
+    index = similar.SimilarityIndex(generate_lands())
+    for k in [1, 10, 100]:
+        result = index.nearest(values, k, bounds)
+        ids, distances = nearest_reference(index, values, k, bounds)
+        assert len(result) == k
+        assert result["id"].tolist() == ids
+        assert np.allclose(result["similarity_distance"], distances)
+# ---------------------------------------------------------------------------- #
+# Une cible sans distance définie ne donne aucune parcelle
+def test_nearest_undefined_target():
+    index = similar.SimilarityIndex(generate_lands(3000))
+    result = index.nearest({"land_area": np.nan, "building_area": 80.}, 5)
+    assert len(result) == 0
+    assert "similarity_distance" in result.columns
+# ============================================================================ #
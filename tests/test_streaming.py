@@ -0,0 +1,81 @@
+# ============================== TEST STREAMING ============================== #
+# Projet :          analyse-cadastre-dvf
+# Fichier :         test_streaming.py
+# Description :     Tests de la lecture incrémentale des fichiers json
+# Auteur :          Vincent Reverdy
+# Contributeur(s) : Vincent Reverdy [2019]
+# Licence :         GNU General Public License 3
+# ============================================================================ #
+
+
+
+# ================================ PREAMBULE ================================= #
+# Packages
+import json
+# Aliases
+import pytest
+# Projet
+from analyse_cadastre_dvf import streaming
+from analyse_cadastre_dvf import benchmark
+# ============================================================================ #
+
+
+
+# ================================== OUTILS ================================== #
+# Écrit une collection d'éléments précédée d'autres clés dans un fichier json
+def write_collection(filename, features, indent = None):
+    collection = {
+        "type": "FeatureCollection",
+        "name": "cadastre [\"features\"]",
+        "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
+        "features": features,
+    }
+    with open(filename, "w") as stream:
+        json.dump(collection, stream, indent = indent, ensure_ascii = False)
+    with open(filename) as stream:
+        return json.load(stream)["features"]
+# ============================================================================ #
+
+
+
+# ================================== TESTS =================================== #
+# La lecture incrémentale donne les mêmes éléments que json.load, quelle que
+# soit la taille des blocs lus et la mise en forme du fichier
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("size", [1, 7, 100, 4096, streaming.chunk_size])
+def test_features_match_json(tmp_path, indent, size):
+    lands, buildings = benchmark.generate_city("01001", 4)
+    features = lands + buildings
+    features[0]["properties"]["nom"] = "Forêt d'Évian, \"lieu-dit\" ]}"
+    filename = str(tmp_path / "collection.json")
+    expected = write_collection(filename, features, indent)
+    assert list(streaming.iterate_features(filename, size)) == expected
+    batches = list(streaming.iterate_batches(filename, 5, size))
+    assert [len(x) for x in batches[:-1]] == [5] * (len(batches) - 1)
+    assert 0 < len(batches[-1]) <= 5
+    assert [x for batch in batches for x in batch] == expected
+# ---------------------------------------------------------------------------- #
+# Une collection vide ne donne aucun élément, et un fichier sans liste
+# d'éléments est une erreur
+def test_empty_and_invalid_files(tmp_path):
+    filename = str(tmp_path / "empty.json")
+    assert write_collection(filename, [], 2) == []
+    assert list(streaming.iterate_features(filename, 3)) == []
+    assert list(streaming.iterate_batches(filename, 5, 3)) == []
+    filename = str(tmp_path / "invalid.json")
+    with open(filename, "w") as stream:
+        json.dump({"type": "FeatureCollection"}, stream)
+    with pytest.raises(ValueError):
+        list(streaming.iterate_features(filename, 3))
+# ---------------------------------------------------------------------------- #
+# Un fichier tronqué au milieu d'un élément est une erreur
+def test_truncated_file(tmp_path):
+    filename = str(tmp_path / "truncated.json")
+    write_collection(filename, benchmark.generate_city("01001", 2)[0])
+    with open(filename) as stream:
+        content = stream.read()
+    with open(filename, "w") as stream:
+        stream.write(content[:len(content) // 2])
+    with pytest.raises(json.JSONDecodeError):
+        list(streaming.iterate_features(filename, 64))
+# ============================================================================ #